@@ -0,0 +1,420 @@
+"""Архив закрытых месяцев measurements в Parquet (нужен pyarrow).
+
+Месяц выгружается в ARCHIVE_DIR/month=ГГГГ-ММ/sensor_id=N/data.parquet
+(колонки ts — секунды от эпохи, value) и удаляется из SQLite. Запросы за
+архивные месяцы читают только нужные файлы по колонкам и объединяются с
+«горячими» строками SQLite (при совпадении времени побеждает SQLite).
+Агрегаты measurement_rollups архивных месяцев сохраняются и не пересчитываются;
+для правки данных месяц сначала возвращается в БД (restore).
+
+python archive.py export               # все закрытые месяцы до текущего
+python archive.py export --before 2025-01
+python archive.py list
+python archive.py restore 2024-06
+"""
+
+import logging
+import os
+import re
+import shutil
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select
+from db_session import BASE_DIR, PARTITIONED
+from init_db import EPOCH
+from partitions import (
+    drop_partition,
+    measurement_source,
+    measurement_tables,
+    month_of,
+    month_start,
+    next_month,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(BASE_DIR, "archive"))
+MONTH_DIR_RE = re.compile(r"^month=(\d{4})-(\d{2})$")
+SENSOR_DIR_RE = re.compile(r"^sensor_id=(\d+)$")
+DATA_FILE = "data.parquet"
+
+ARROW_AGGREGATES = {
+    "avg": "mean",
+    "sum": "sum",
+    "min": "min",
+    "max": "max",
+    "count": "count",
+}
+
+
+def month_dir(month):
+    return os.path.join(ARCHIVE_DIR, f"month={month[0]:04d}-{month[1]:02d}")
+
+
+class ArchivedDataError(Exception):
+    """Изменение затрагивает месяцы в архиве: их сначала нужно восстановить."""
+
+
+def _listed_months():
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    months = []
+    for name in os.listdir(ARCHIVE_DIR):
+        match = MONTH_DIR_RE.match(name)
+        if match:
+            months.append((int(match.group(1)), int(match.group(2))))
+    return sorted(months)
+
+
+def archived_months():
+    """Месяцы в архиве по возрастанию (пусто, если pyarrow не установлен)."""
+    months = _listed_months()
+    if months and pa is None:
+        logger.warning("В %s есть архив, но pyarrow не установлен", ARCHIVE_DIR)
+        return []
+    return months
+
+
+def archived_in_range(start_dt=None, end_dt=None):
+    return [
+        month
+        for month in archived_months()
+        if (start_dt is None or month >= month_of(start_dt))
+        and (end_dt is None or month <= month_of(end_dt))
+    ]
+
+
+def archived_sensor_months(sensor_ids=None, start_dt=None, end_dt=None):
+    """Месяцы архива за [start_dt, end_dt], где есть файлы сенсоров sensor_ids.
+
+    Смотрит только каталоги, поэтому работает и без pyarrow.
+    """
+    if sensor_ids is not None:
+        sensor_ids = {int(s) for s in sensor_ids}
+    return [
+        month
+        for month in _listed_months()
+        if (start_dt is None or month_start(next_month(month)) > start_dt)
+        and (end_dt is None or month_start(month) <= end_dt)
+        and _sensor_files([month], sensor_ids)
+    ]
+
+
+def require_not_archived(sensor_ids=None, start_dt=None, end_dt=None):
+    """ArchivedDataError, если изменение сенсоров за период задевает архив.
+
+    Удаление и перенос измерений работают только с SQLite; архивные месяцы
+    нужно сначала вернуть в БД (python archive.py restore ГГГГ-ММ).
+    """
+    require_months_writable(archived_sensor_months(sensor_ids, start_dt, end_dt))
+
+
+def require_months_writable(months):
+    """ArchivedDataError, если среди months есть архивные.
+
+    Запись в архивный месяц не попала бы в его агрегаты (они не пересчитываются).
+    """
+    months = sorted(set(months).intersection(_listed_months()))
+    if months:
+        names = ", ".join(f"{year:04d}-{mon:02d}" for year, mon in months)
+        raise ArchivedDataError(
+            f"данные за {names} в архиве, сначала верните их в БД (archive.py restore)"
+        )
+
+
+def count_archived(sensor_ids=None, start_dt=None, end_dt=None):
+    """Число строк архива сенсоров за [start_dt, end_dt) (по метаданным Parquet,
+    если период не задан)."""
+    if start_dt is None and end_dt is None:
+        if sensor_ids is not None:
+            sensor_ids = {int(s) for s in sensor_ids}
+        return sum(
+            pq.ParquetFile(path).metadata.num_rows
+            for _, path in _sensor_files(archived_months(), sensor_ids)
+        )
+    table = read_archive(sensor_ids, start_dt, end_dt)
+    return 0 if table is None else len(table)
+
+
+def hot_ranges(start_ts, end_ts):
+    """Части [start_ts, end_ts) вне архивных месяцев (секунды от эпохи, None — без границы).
+
+    Смотрит только каталоги: без pyarrow агрегаты архива тоже не трогаются.
+    """
+    ranges = []
+    lo = start_ts
+    for month in _listed_months():
+        month_lo = int((month_start(month) - EPOCH).total_seconds())
+        month_hi = int((month_start(next_month(month)) - EPOCH).total_seconds())
+        if (end_ts is not None and month_lo >= end_ts) or (
+            lo is not None and month_hi <= lo
+        ):
+            continue
+        if lo is None or lo < month_lo:
+            ranges.append((lo, month_lo))
+        lo = month_hi
+    if end_ts is None or lo is None or lo < end_ts:
+        ranges.append((lo, end_ts))
+    return ranges
+
+
+def _sensor_files(months, sensor_ids=None):
+    files = []
+    for month in months:
+        path = month_dir(month)
+        for name in sorted(os.listdir(path)):
+            match = SENSOR_DIR_RE.match(name)
+            if match and (sensor_ids is None or int(match.group(1)) in sensor_ids):
+                files.append((int(match.group(1)), os.path.join(path, name, DATA_FILE)))
+    return files
+
+
+def read_archive(sensor_ids=None, start_dt=None, end_dt=None):
+    """Строки архива за [start_dt, end_dt): Table (sensor_id, ts, value) или None.
+
+    Читаются только файлы нужных месяцев и сенсоров, фильтр по ts — на уровне
+    row group'ов Parquet.
+    """
+    months = archived_in_range(start_dt, end_dt)
+    if not months:
+        return None
+    if sensor_ids is not None:
+        sensor_ids = {int(s) for s in sensor_ids}
+    tables = []
+    for sensor_id, path in _sensor_files(months, sensor_ids):
+        condition = None
+        if start_dt is not None:
+            condition = ds.field("ts") >= int((start_dt - EPOCH).total_seconds())
+        if end_dt is not None:
+            upper = ds.field("ts") < int((end_dt - EPOCH).total_seconds())
+            condition = upper if condition is None else condition & upper
+        table = ds.dataset(path, format="parquet").to_table(filter=condition)
+        tables.append(
+            table.add_column(
+                0, "sensor_id", pa.array(np.full(len(table), sensor_id, np.int64))
+            )
+        )
+    if not tables:
+        return None
+    return pa.concat_tables(tables)
+
+
+def _hot_table(db, sensor_ids, start_dt, end_dt):
+    """Строки SQLite за период в том же виде, что read_archive."""
+    M = measurement_source(db, start_dt, end_dt)
+    query = select(M.sensor_id, M.measurement_time, M.value)
+    if sensor_ids is not None:
+        query = query.where(M.sensor_id.in_(list(sensor_ids)))
+    if start_dt is not None:
+        query = query.where(M.measurement_time >= start_dt)
+    if end_dt is not None:
+        query = query.where(M.measurement_time < end_dt)
+    rows = db.execute(query).all()
+    return pa.table(
+        {
+            "sensor_id": pa.array([r[0] for r in rows], pa.int64()),
+            "ts": pa.array(
+                [(r[1] - EPOCH) // timedelta(seconds=1) for r in rows], pa.int64()
+            ),
+            "value": pa.array([r[2] for r in rows], pa.float64()),
+        }
+    )
+
+
+def merged_table(db, sensor_ids, start_dt, end_dt):
+    """Архив и горячие строки за период; при совпадении (sensor_id, ts) — из SQLite."""
+    archived = read_archive(sensor_ids, start_dt, end_dt)
+    hot = _hot_table(db, sensor_ids, start_dt, end_dt)
+    if archived is None:
+        return hot
+    if len(hot):
+        key = pc.add(pc.multiply(archived["sensor_id"], 1 << 40), archived["ts"])
+        hot_key = pc.add(pc.multiply(hot["sensor_id"], 1 << 40), hot["ts"])
+        archived = archived.filter(pc.invert(pc.is_in(key, value_set=hot_key)))
+    return pa.concat_tables([archived.select(hot.column_names), hot])
+
+
+def aggregate_archive(
+    db, sensor_id, start_dt, end_dt, interval_minutes, agg="avg", by_sensor=False
+):
+    """Агрегаты по интервалам, как comparison_utils.aggregate_query(...).all(),
+    но по объединению архива и SQLite, колоночно в pyarrow."""
+    if isinstance(sensor_id, (list, tuple, set)):
+        sensor_ids = list(sensor_id)
+    else:
+        sensor_ids = None if sensor_id is None else [sensor_id]
+    table = merged_table(db, sensor_ids, start_dt, end_dt)
+    table = table.filter(pc.is_valid(table["value"]))
+    step = int(interval_minutes) * 60
+    # целочисленное деление, как bucket_epoch_expr в SQLite
+    table = table.append_column(
+        "bucket", pc.multiply(pc.divide(table["ts"], step), step)
+    )
+    keys = ["sensor_id", "bucket"] if by_sensor else ["bucket"]
+    result = table.group_by(keys).aggregate([("value", ARROW_AGGREGATES[agg])])
+    result = result.sort_by([(key, "ascending") for key in keys])
+    columns = [result[key].to_pylist() for key in keys]
+    values = result[f"value_{ARROW_AGGREGATES[agg]}"].to_pylist()
+    return list(zip(*columns, values))
+
+
+def iter_archive(sensor_id, start_dt=None, end_dt=None):
+    """(measurement_time, value) сенсора из архива по возрастанию времени."""
+    table = read_archive([sensor_id], start_dt, end_dt)
+    if table is None:
+        return
+    table = table.sort_by("ts")
+    for ts, value in zip(table["ts"].to_pylist(), table["value"].to_pylist()):
+        yield EPOCH + timedelta(seconds=ts), value
+
+
+def merge_archived(archived, hot):
+    """Слияние упорядоченных по времени потоков архива и SQLite.
+
+    При совпадении времени остаётся значение из SQLite.
+    """
+    archived = iter(archived)
+    hot = iter(hot)
+    a = next(archived, None)
+    h = next(hot, None)
+    while a is not None or h is not None:
+        if h is None or (a is not None and a[0] < h[0]):
+            yield a
+            a = next(archived, None)
+        else:
+            if a is not None and a[0] == h[0]:
+                a = next(archived, None)
+            yield h
+            h = next(hot, None)
+
+
+def export_month(db, month):
+    """Выгружает месяц в Parquet и удаляет его из SQLite; возвращает число строк.
+
+    Файлы пишутся во временный каталог и переименовываются целиком, так что
+    месяц либо полностью в архиве, либо нет. Коммит — за вызывающим.
+    """
+    start_dt, end_dt = month_start(month), month_start(next_month(month))
+    table = _hot_table(db, None, start_dt, end_dt)
+    if not len(table):
+        return 0
+    if os.path.exists(month_dir(month)):
+        raise FileExistsError(f"Месяц уже в архиве: {month_dir(month)}")
+    tmp_dir = month_dir(month) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    sensor_ids = table["sensor_id"]
+    for sensor_id in pc.unique(sensor_ids).to_pylist():
+        part = table.filter(pc.equal(sensor_ids, sensor_id)).select(["ts", "value"])
+        os.makedirs(os.path.join(tmp_dir, f"sensor_id={sensor_id}"))
+        pq.write_table(
+            part.sort_by("ts"),
+            os.path.join(tmp_dir, f"sensor_id={sensor_id}", DATA_FILE),
+            compression="zstd",
+        )
+    os.rename(tmp_dir, month_dir(month))
+    if PARTITIONED:
+        drop_partition(db, month)
+    else:
+        for t in measurement_tables(db, start_dt, end_dt):
+            db.execute(
+                t.delete().where(
+                    t.c.measurement_time >= start_dt, t.c.measurement_time < end_dt
+                )
+            )
+    return len(table)
+
+
+def restore_month(db, month):
+    """Возвращает месяц из архива в SQLite (для правки); коммитит сам."""
+    from comparison_utils import bulk_upsert_measurements
+
+    table = read_archive(None, month_start(month), month_start(next_month(month)))
+    if table is None:
+        return 0
+    records = [
+        {
+            "sensor_id": sensor_id,
+            "measurement_time": EPOCH + timedelta(seconds=ts),
+            "value": value,
+        }
+        for sensor_id, ts, value in zip(
+            table["sensor_id"].to_pylist(),
+            table["ts"].to_pylist(),
+            table["value"].to_pylist(),
+        )
+    ]
+    # пока каталог переименован, месяц не считается архивным: в него можно
+    # писать, и агрегаты пересчитываются из восстановленных строк при commit
+    restoring = month_dir(month) + ".restoring"
+    os.rename(month_dir(month), restoring)
+    try:
+        bulk_upsert_measurements(db, records)
+        db.commit()
+    except Exception:
+        db.rollback()
+        os.rename(restoring, month_dir(month))
+        raise
+    shutil.rmtree(restoring)
+    return len(records)
+
+
+if __name__ == "__main__":
+    import argparse
+    from db_session import SessionLocal
+    from partitions import existing_months
+
+    parser = argparse.ArgumentParser(description="Parquet-архив закрытых месяцев")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="выгрузить месяцы до --before")
+    export.add_argument("--before", help="ГГГГ-ММ, по умолчанию текущий месяц")
+    sub.add_parser("list", help="месяцы в архиве")
+    restore = sub.add_parser("restore", help="вернуть месяц ГГГГ-ММ в БД")
+    restore.add_argument("month")
+    args = parser.parse_args()
+    if pa is None:
+        parser.error("для архива нужен pyarrow")
+
+    with SessionLocal() as db:
+        if args.command == "list":
+            for month in archived_months():
+                files = _sensor_files([month])
+                rows = sum(pq.ParquetFile(path).metadata.num_rows for _, path in files)
+                print(
+                    f"{month[0]:04d}-{month[1]:02d}: {len(files)} сенсоров, {rows} строк"
+                )
+        elif args.command == "restore":
+            month = month_of(datetime.strptime(args.month, "%Y-%m"))
+            print(f"Восстановлено строк: {restore_month(db, month)}")
+        else:
+            before = month_of(
+                datetime.strptime(args.before, "%Y-%m")
+                if args.before
+                else datetime.now()
+            )
+            M = measurement_source(db)
+            if PARTITIONED:
+                months = [m for m in existing_months(db) if m < before]
+            else:
+                first = db.execute(
+                    select(M.measurement_time).order_by(M.measurement_time).limit(1)
+                ).scalar()
+                months = []
+                month = month_of(first) if first else before
+                while month < before:
+                    months.append(month)
+                    month = next_month(month)
+            for month in months:
+                if month in archived_months():
+                    continue
+                rows = export_month(db, month)
+                db.commit()
+                if rows:
+                    print(f"{month[0]:04d}-{month[1]:02d}: выгружено строк {rows}")
@@ -0,0 +1,152 @@
+"""Задержка чтения при параллельной загрузке для профилей SQLite из db_session.
+
+python bench_db.py --profiles default wal --seconds 10
+DB_STORAGE=compact python bench_db.py  # то же для компактной схемы measurements
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import bindparam, insert, text
+from db_session import STORAGE_LAYOUT, make_engine
+from init_db import MEASUREMENT_TIME_COLUMN, Base, Measurement, Sensor
+
+START = datetime(2025, 1, 1)
+
+READ_SQL = text(
+    "SELECT COUNT(*), AVG(value) FROM measurements "
+    f"WHERE sensor_id = :sensor_id AND {MEASUREMENT_TIME_COLUMN} >= :start_dt "
+    f"AND {MEASUREMENT_TIME_COLUMN} < :end_dt"
+).bindparams(
+    bindparam("start_dt", type_=Measurement.measurement_time.type),
+    bindparam("end_dt", type_=Measurement.measurement_time.type),
+)
+
+INSERT_SQL = (
+    f"INSERT INTO measurements (sensor_id, {MEASUREMENT_TIME_COLUMN}, value) "
+    "VALUES (?, ?, ?)"
+)
+
+
+def make_rows(sensor_id, first, count):
+    """Строки измерений с шагом 1 с во внутреннем формате времени схемы хранения."""
+    times = np.datetime64(START, "s") + np.arange(first, first + count).astype(
+        "timedelta64[s]"
+    )
+    if STORAGE_LAYOUT == "compact":
+        stamps = times.astype(np.int64)
+    else:
+        stamps = np.char.replace(np.datetime_as_string(times, unit="us"), "T", " ")
+    return list(
+        zip([sensor_id] * count, stamps.tolist(), (np.arange(count) % 1000.0).tolist())
+    )
+
+
+def writer(engine, stop, batch, stats):
+    """Имитация загрузки файла: большие пачки вставок в одной транзакции."""
+    offset = 0
+    while not stop.is_set():
+        rows = make_rows(2, offset, batch)
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            conn.exec_driver_sql(INSERT_SQL, rows)
+        stats["write_seconds"] += time.perf_counter() - started
+        stats["rows_written"] += batch
+        offset += batch
+
+
+def reader(engine, stop, latencies, seed_rows):
+    """Запросы страницы графика: агрегат за случайные сутки сенсора 1."""
+    rng = np.random.default_rng()
+    while not stop.is_set():
+        start_dt = START + timedelta(
+            seconds=int(rng.integers(0, max(seed_rows - 86400, 1)))
+        )
+        started = time.perf_counter()
+        with engine.connect() as conn:
+            conn.execute(
+                READ_SQL,
+                {
+                    "sensor_id": 1,
+                    "start_dt": start_dt,
+                    "end_dt": start_dt + timedelta(days=1),
+                },
+            ).one()
+        latencies.append(time.perf_counter() - started)
+
+
+def run_profile(profile, seconds, batch, readers, seed_rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(
+            f"sqlite:///{os.path.join(tmp, 'bench.db')}", profile, pool_size=readers + 1
+        )
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(
+                insert(Sensor),
+                [
+                    {
+                        "sensor_name": "bench 1",
+                        "sensor_type": "radiation",
+                        "unit": "W/m2",
+                    },
+                    {
+                        "sensor_name": "bench 2",
+                        "sensor_type": "radiation",
+                        "unit": "W/m2",
+                    },
+                ],
+            )
+            conn.exec_driver_sql(INSERT_SQL, make_rows(1, 0, seed_rows))
+
+        stop = threading.Event()
+        stats = {"rows_written": 0, "write_seconds": 0.0}
+        latencies = []
+        threads = [threading.Thread(target=writer, args=(engine, stop, batch, stats))]
+        threads += [
+            threading.Thread(target=reader, args=(engine, stop, latencies, seed_rows))
+            for _ in range(readers)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    lat = np.array(latencies) * 1000
+    return {
+        "profile": profile,
+        "reads": len(lat),
+        "p50_ms": np.percentile(lat, 50) if len(lat) else np.nan,
+        "p95_ms": np.percentile(lat, 95) if len(lat) else np.nan,
+        "max_ms": lat.max() if len(lat) else np.nan,
+        "rows_per_s": stats["rows_written"] / max(stats["write_seconds"], 1e-9),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", nargs="+", default=["default", "wal"])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument(
+        "--batch", type=int, default=100000, help="строк в транзакции записи"
+    )
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seed-rows", type=int, default=500000)
+    args = parser.parse_args()
+
+    print(
+        f"{'профиль':<10}{'чтений':>8}{'p50, мс':>10}{'p95, мс':>10}{'max, мс':>10}{'запись, строк/с':>18}"
+    )
+    for profile in args.profiles:
+        r = run_profile(profile, args.seconds, args.batch, args.readers, args.seed_rows)
+        print(
+            f"{r['profile']:<10}{r['reads']:>8}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+            f"{r['max_ms']:>10.1f}{r['rows_per_s']:>18.0f}"
+        )
@@ -1,15 +1,43 @@
 import logging
+import numpy as np
 import pandas as pd
 import re
-from collections import defaultdict
 from datetime import datetime, timedelta
 from collections import namedtuple
-from init_db import Sensor, Measurement
+from init_db import EpochDateTime, Sensor, Measurement, MeasurementRollup
+from sqlalchemy import Integer, cast, func, select, type_coerce
 from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sensor_labels import VIRTUAL_SENSOR_GROUPS, MONTH_DIGIT
+from sensor_registry import sensor_registry
+from rollups import EPOCH, mark_rollups_dirty, pick_rollup_resolution, to_epoch
+from partitions import measurement_source, month_of, write_targets
+from archive import (
+    aggregate_archive,
+    archived_in_range,
+    iter_archive,
+    merge_archived,
+    merged_table,
+    require_months_writable,
+)
 
 DataPoint = namedtuple("DataPoint", ["measurement_time", "value"])
 
+# time — datetime64[s], values — float64 с NaN вместо NULL
+Series = namedtuple("Series", ["time", "values"])
+# time — объединение моментов всех сенсоров (T), values — (T, S) с NaN,
+# sensor_ids — порядок столбцов values
+SensorMatrix = namedtuple("SensorMatrix", ["time", "values", "sensor_ids"])
+
+UPSERT_CHUNK_SIZE = 5000
+STREAM_BATCH_SIZE = 10000
+SQL_AGGREGATES = {
+    "avg": func.avg,
+    "sum": func.sum,
+    "min": func.min,
+    "max": func.max,
+    "count": func.count,
+}
+
 logger = logging.getLogger(__name__)
 
 
@@ -80,39 +108,115 @@ def parse_value_by_type(col, val):
     return value
 
 
-def process_measurements(df, sensor_cols, sensor_map, db, filename, errors):
-    inserted = 0
-    for index, row in df.iterrows():
-        try:
-            date_str = str(row.iloc[0]).strip()
-            time_str = str(row.iloc[1]).strip()
-            dt = datetime.strptime(f"{date_str} {time_str}", "%d.%m.%Y %H:%M:%S")
-        except Exception as e:
-            errors.append(f"{filename}, строка {index+2}: ошибка даты/времени — {e}")
-            continue
+def parse_values_by_type(col, values):
+    """Векторный аналог parse_value_by_type для целого столбца.
 
-        for col in sensor_cols:
-            try:
-                value = parse_value_by_type(col, row[col])
-                if value is None:
-                    continue
-
-                sensor_id = sensor_map[col]
-                stmt = (
-                    sqlite_insert(Measurement)
-                    .values(sensor_id=sensor_id, measurement_time=dt, value=value)
-                    .on_conflict_do_update(
-                        index_elements=["sensor_id", "measurement_time"],
-                        set_={"value": value},
-                    )
-                )
-                db.execute(stmt)
-                inserted += 1
-            except Exception as e:
-                errors.append(f"{filename}, строка {index+2}, столбец '{col}': {e}")
+    Возвращает float Series, где нераспознанные и выходящие за допустимый
+    диапазон значения заменены на NaN.
+    """
+    col_l = col.lower()
+    s = values.astype(str).str.strip()
+
+    if any(word in col_l for word in ["wind", "ветр", "temp", "температ"]):
+        s = s.str.lower()
+        direct = pd.to_numeric(s, errors="coerce")
+        result = pd.to_numeric(s.str.replace(",", ".", regex=False), errors="coerce")
+
+        parts = s.str.extract(r"^(\d+)[\.,]?\s*([а-яё]+)")
+        frac = parts[1].str[:4].map(MONTH_DIGIT)
+        month_mask = parts[0].notna() & frac.notna()
+        result[month_mask] = pd.to_numeric(
+            parts[0][month_mask] + "." + frac[month_mask], errors="coerce"
+        )
+
+        excel_mask = (direct > 40000) & (direct < 90000)
+        if excel_mask.any():
+            dt = pd.Timestamp(1899, 12, 30) + pd.to_timedelta(
+                direct[excel_mask], unit="D"
+            )
+            result[excel_mask] = pd.to_numeric(
+                dt.dt.day.astype(str) + "." + dt.dt.month.astype(str)
+            )
+    else:
+        result = pd.to_numeric(s.str.replace(",", ".", regex=False), errors="coerce")
+
+    if any(word in col_l for word in ["wind", "ветр"]):
+        result = result.where((result >= 0) & (result <= 80))
+    if any(word in col_l for word in ["temp", "температ"]):
+        result = result.where((result >= -60) & (result <= 70))
+
+    return result.astype(float)
+
+
+def bulk_upsert_measurements(db, records, chunk_size=UPSERT_CHUNK_SIZE):
+    """Вставляет/обновляет измерения пачками через executemany.
+
+    records — список словарей с ключами sensor_id, measurement_time, value.
+    В архивные месяцы не пишет (ArchivedDataError).
+    """
+    require_months_writable({month_of(r["measurement_time"]) for r in records})
+    conn = db.connection()
+    inserted = 0
+    for table, rows in write_targets(db, records):
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.sensor_id, table.c.measurement_time],
+            set_={"value": stmt.excluded.value},
+        )
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start : start + chunk_size]
+            conn.execute(stmt, chunk)
+            inserted += len(chunk)
+
+    bounds = {}
+    for r in records:
+        dt = r["measurement_time"]
+        lo, hi = bounds.get(r["sensor_id"], (dt, dt))
+        bounds[r["sensor_id"]] = (min(lo, dt), max(hi, dt))
+    for sensor_id, (lo, hi) in bounds.items():
+        mark_rollups_dirty(db, [sensor_id], lo, hi)
     return inserted
 
 
+def process_measurements(df, sensor_cols, sensor_map, db, filename, errors):
+    date_str = df.iloc[:, 0].astype(str).str.strip()
+    time_str = df.iloc[:, 1].astype(str).str.strip()
+    times = pd.to_datetime(
+        date_str + " " + time_str, format="%d.%m.%Y %H:%M:%S", errors="coerce"
+    )
+    for index in df.index[times.isna()]:
+        errors.append(
+            f"{filename}, строка {index+2}: ошибка даты/времени — "
+            f"'{date_str[index]} {time_str[index]}'"
+        )
+
+    values = pd.DataFrame(
+        {col: parse_values_by_type(col, df[col]) for col in sensor_cols},
+        index=df.index,
+    )
+    values["measurement_time"] = times
+    long_df = values.melt(
+        id_vars=["measurement_time"], var_name="column", value_name="value"
+    ).dropna(subset=["measurement_time", "value"])
+    if long_df.empty:
+        return 0
+
+    sensor_ids = long_df["column"].map(sensor_map).to_numpy()
+    records = [
+        {"sensor_id": int(sensor_id), "measurement_time": dt, "value": value}
+        for sensor_id, dt, value in zip(
+            sensor_ids,
+            pd.DatetimeIndex(long_df["measurement_time"]).to_pydatetime(),
+            long_df["value"].to_numpy(),
+        )
+    ]
+    try:
+        return bulk_upsert_measurements(db, records)
+    except Exception as e:
+        errors.append(f"{filename}: ошибка записи измерений — {e}")
+        return 0
+
+
 def process_excel_energy_file(file, db, errors):
     skipped_time = 0
     skipped_value = 0
@@ -144,16 +248,9 @@ def process_excel_energy_file(file, db, errors):
 
         df[df.columns[1]] = df[df.columns[1]].dt.floor("min")
 
-        def correct_time(dt):
-            if pd.isna(dt):
-                return dt
-            return (
-                dt + timedelta(hours=5)
-                if dt.date() < datetime(2024, 3, 1).date()
-                else dt + timedelta(hours=4)
-            )
-
-        df[df.columns[1]] = df[df.columns[1]].apply(correct_time)
+        times = df[df.columns[1]]
+        shift_hours = np.where(times < pd.Timestamp(2024, 3, 1), 5, 4)
+        df[df.columns[1]] = times + pd.to_timedelta(shift_hours, unit="h")
 
         melted = df.melt(
             id_vars=[df.columns[1]],
@@ -162,6 +259,7 @@ def process_excel_energy_file(file, db, errors):
             value_name="value",
         )
         melted = melted.rename(columns={df.columns[1]: "measurement_time"})
+        melted["value"] = pd.to_numeric(melted["value"], errors="coerce")
         skipped_value = melted["value"].isna().sum()
         skipped_time = melted["measurement_time"].isna().sum()
         melted = melted.dropna(subset=["value", "measurement_time"])
@@ -172,48 +270,48 @@ def process_excel_energy_file(file, db, errors):
 
         if any("Показания счетчика" in col for col in original_columns):
             print("Обнаружены накопленные данные — преобразуем в приращения.")
-            melted.sort_values("measurement_time", inplace=True)
-            for sensor_name in melted["sensor_name"].unique():
-                mask = melted["sensor_name"] == sensor_name
-                melted.loc[mask, "value"] = melted.loc[mask, "value"].diff()
+            melted = melted.sort_values("measurement_time", kind="stable")
+            melted["value"] = melted.groupby("sensor_name")["value"].diff()
             melted = melted.dropna(subset=["value"])
 
-        for _, row in melted.iterrows():
+        sensor_map = {}
+        for raw_sensor_name in melted["sensor_name"].unique():
             try:
-                raw_sensor_name = row["sensor_name"].strip()
-                full_sensor_name = f"{source_label} {raw_sensor_name}"
-
-                if "Активная энергия" in raw_sensor_name:
+                sensor_name = raw_sensor_name.strip()
+                if "Активная энергия" in sensor_name:
                     sensor_type = "energy_active"
                     unit = "kWh"
-                elif "Реактивная энергия" in raw_sensor_name:
+                elif "Реактивная энергия" in sensor_name:
                     sensor_type = "energy_reactive"
                     unit = "kvarh"
                 else:
                     sensor_type = "unknown"
                     unit = ""
 
-                sensor_id = get_sensor_id(db, full_sensor_name, sensor_type, unit)
-                if pd.isna(sensor_id) or not isinstance(sensor_id, int):
-                    skipped_sensor += 1
-                    continue
-
-                stmt = (
-                    sqlite_insert(Measurement)
-                    .values(
-                        sensor_id=sensor_id,
-                        measurement_time=row["measurement_time"],
-                        value=float(row["value"]),
-                    )
-                    .on_conflict_do_update(
-                        index_elements=["sensor_id", "measurement_time"],
-                        set_={"value": float(row["value"])},
-                    )
+                sensor_id = get_sensor_id(
+                    db, f"{source_label} {sensor_name}", sensor_type, unit
                 )
-                db.execute(stmt)
-                inserted += 1
+                if not pd.isna(sensor_id) and isinstance(sensor_id, int):
+                    sensor_map[raw_sensor_name] = sensor_id
             except Exception as e:
-                errors.append(f"Ошибка в строке Excel: {e}")
+                errors.append(f"Ошибка сенсора '{raw_sensor_name}' в Excel: {e}")
+
+        melted["sensor_id"] = melted["sensor_name"].map(sensor_map)
+        skipped_sensor = int(melted["sensor_id"].isna().sum())
+        melted = melted.dropna(subset=["sensor_id"])
+
+        records = [
+            {"sensor_id": int(sensor_id), "measurement_time": dt, "value": value}
+            for sensor_id, dt, value in zip(
+                melted["sensor_id"].to_numpy(),
+                pd.DatetimeIndex(melted["measurement_time"]).to_pydatetime(),
+                melted["value"].to_numpy(dtype=float),
+            )
+        ]
+        try:
+            inserted = bulk_upsert_measurements(db, records)
+        except Exception as e:
+            errors.append(f"Ошибка записи данных Excel: {e}")
 
         print(
             f"Всего вставлено: {inserted}, пропущено по времени: {skipped_time}, по значению: {skipped_value}, по sensor_id: {skipped_sensor}"
@@ -231,11 +329,11 @@ def get_sensor_names(db, actual_id: int, forecast_id: int):
             actual_name = "Среднее"
             actual_unit = "W/m2"
         else:
-            sensor = db.query(Sensor).get(actual_id)
+            sensor = sensor_registry.get(db, actual_id)
             actual_name = sensor.sensor_name if sensor else None
             actual_unit = sensor.unit if sensor else ""
 
-        forecast = db.query(Sensor).get(forecast_id)
+        forecast = sensor_registry.get(db, forecast_id)
         forecast_name = forecast.sensor_name if forecast else None
         forecast_unit = forecast.unit if forecast else ""
 
@@ -259,14 +357,21 @@ def determine_sensor_type_and_unit(col_name):
 
 def get_measurements(db, sensor_id: int, start_dt=None, end_dt=None):
     try:
-        query = db.query(Measurement.measurement_time, Measurement.value).filter(
-            Measurement.sensor_id == sensor_id
-        )
+        M = measurement_source(db, start_dt, end_dt)
+        query = db.query(M.measurement_time, M.value).filter(M.sensor_id == sensor_id)
         if start_dt:
-            query = query.filter(Measurement.measurement_time >= start_dt)
+            query = query.filter(M.measurement_time >= start_dt)
         if end_dt:
-            query = query.filter(Measurement.measurement_time < end_dt)
-        return query.order_by(Measurement.measurement_time).all()
+            query = query.filter(M.measurement_time < end_dt)
+        rows = query.order_by(M.measurement_time).all()
+        if archived_in_range(start_dt, end_dt):
+            rows = list(
+                merge_archived(
+                    map(DataPoint._make, iter_archive(sensor_id, start_dt, end_dt)),
+                    rows,
+                )
+            )
+        return rows
     except Exception as e:
         logger.error(
             "Error in get_measurements for sensor %s: %s", sensor_id, e, exc_info=True
@@ -274,44 +379,85 @@ def get_measurements(db, sensor_id: int, start_dt=None, end_dt=None):
         raise
 
 
-def get_common_time_series(actual_data, forecast_data):
-    all_times = sorted(
-        set(
-            [m.measurement_time for m in actual_data]
-            + [m.measurement_time for m in forecast_data]
-        )
-    )
-    actual_dict = {m.measurement_time: m.value for m in actual_data}
-    forecast_dict = {m.measurement_time: m.value for m in forecast_data}
+def iter_measurements(
+    db, sensor_id: int, start_dt=None, end_dt=None, batch_size=STREAM_BATCH_SIZE
+):
+    """Потоково отдаёт (measurement_time, value) по возрастанию времени."""
+    M = measurement_source(db, start_dt, end_dt)
+    query = select(M.measurement_time, M.value).where(M.sensor_id == sensor_id)
+    if start_dt:
+        query = query.where(M.measurement_time >= start_dt)
+    if end_dt:
+        query = query.where(M.measurement_time < end_dt)
+    query = query.order_by(M.measurement_time)
+    result = db.execute(query.execution_options(yield_per=batch_size))
+    try:
+        if archived_in_range(start_dt, end_dt):
+            yield from merge_archived(
+                map(DataPoint._make, iter_archive(sensor_id, start_dt, end_dt)), result
+            )
+        else:
+            yield from result
+    finally:
+        result.close()
+
+
+def merge_time_series(actual_rows, forecast_rows):
+    """Слияние двух упорядоченных по времени потоков в (time, actual, forecast)
+    без построения множеств и словарей в памяти."""
+    actual_iter = iter(actual_rows)
+    forecast_iter = iter(forecast_rows)
+    a = next(actual_iter, None)
+    f = next(forecast_iter, None)
+    while a is not None or f is not None:
+        if f is None or (a is not None and a[0] < f[0]):
+            yield a[0], a[1], None
+            a = next(actual_iter, None)
+        elif a is None or f[0] < a[0]:
+            yield f[0], None, f[1]
+            f = next(forecast_iter, None)
+        else:
+            yield a[0], a[1], f[1]
+            a = next(actual_iter, None)
+            f = next(forecast_iter, None)
+
 
-    return all_times, actual_dict, forecast_dict
+def comparison_row(t, a, f):
+    """Строка экспорта сравнения: время, факт, прогноз, ошибка, ошибка (%)."""
+    diff = (a - f) if a is not None and f is not None else ""
+    percent = (abs(diff) / a * 100) if a and f else ""
+    return [t.strftime("%Y-%m-%d %H:%M:%S"), a, f, diff, percent]
 
 
 def get_sensor_id(db, sensor_name, sensor_type, unit):
-    sensor = db.query(Sensor).filter_by(sensor_name=sensor_name).first()
+    sensor = sensor_registry.get_by_name(db, sensor_name)
     if sensor:
         return sensor.sensor_id
     new_sensor = Sensor(sensor_name=sensor_name, sensor_type=sensor_type, unit=unit)
     db.add(new_sensor)
     db.flush()
+    sensor_registry.add(db, new_sensor)
     return new_sensor.sensor_id
 
 
 def compare_sensors(db, actual_id, forecast_id, start_dt, end_dt):
-    actual_data = (
+    actual = (
         get_avg_measurements_for_all(db, start_dt, end_dt)
         if actual_id == -1
-        else get_measurements(db, actual_id, start_dt, end_dt)
-    )
-    forecast_data = get_measurements(db, forecast_id, start_dt, end_dt)
-    labels, actual_dict, forecast_dict = get_common_time_series(
-        actual_data, forecast_data
+        else fetch_series(db, actual_id, start_dt, end_dt)
     )
+    forecast = fetch_series(db, forecast_id, start_dt, end_dt)
+    labels = np.union1d(actual.time, forecast.time)
+
+    def aligned(series):
+        values = np.full(len(labels), np.nan)
+        values[np.searchsorted(labels, series.time)] = series.values
+        return [None if np.isnan(v) else v for v in values.tolist()]
 
     return {
-        "labels": labels,
-        "actual_values": [actual_dict.get(t) for t in labels],
-        "forecast_values": [forecast_dict.get(t) for t in labels],
+        "labels": labels.astype(object).tolist(),
+        "actual_values": aligned(actual),
+        "forecast_values": aligned(forecast),
     }
 
 
@@ -372,71 +518,238 @@ def parse_date_range(start_str, end_str):
 
 
 def get_avg_measurements_for_all(db, start_dt, end_dt):
-    sensors = (
-        db.query(Sensor)
-        .filter(
-            Sensor.sensor_type == "radiation", ~Sensor.sensor_name.ilike("%forecast%")
-        )
-        .all()
+    """Среднее по всем фактическим пиранометрам в каждый момент времени (Series)."""
+    all_ids = [
+        s.sensor_id
+        for s in sensor_registry.all(db)
+        if s.sensor_type == "radiation" and "forecast" not in s.sensor_name.lower()
+    ]
+    matrix = fetch_matrix(db, all_ids, start_dt, end_dt)
+    present = ~np.isnan(matrix.values)
+    counts = present.sum(axis=1)
+    sums = np.where(present, matrix.values, 0.0).sum(axis=1)
+    has_values = counts > 0
+    return Series(matrix.time[has_values], sums[has_values] / counts[has_values])
+
+
+def group_measurements(series, interval_minutes):
+    """Средние Series по интервалам interval_minutes внутри часа: {datetime: avg}."""
+    valid = ~np.isnan(series.values)
+    ts = series.time[valid].astype(np.int64)
+    values = series.values[valid]
+    minute = ts % 3600 // 60
+    bucket = ts - ts % 3600 + minute // interval_minutes * interval_minutes * 60
+    buckets, inverse = np.unique(bucket, return_inverse=True)
+    avg = np.bincount(inverse, weights=values) / np.bincount(inverse)
+    return dict(
+        zip(buckets.astype("datetime64[s]").astype(object).tolist(), avg.tolist())
     )
-    all_ids = [s.sensor_id for s in sensors]
-
-    all_data = (
-        db.query(Measurement)
-        .filter(
-            Measurement.sensor_id.in_(all_ids),
-            Measurement.measurement_time >= start_dt,
-            Measurement.measurement_time < end_dt,
+
+
+def epoch_expr(time_column):
+    """SQL-выражение времени измерения в целых секундах от эпохи."""
+    if isinstance(time_column.type, EpochDateTime):
+        return type_coerce(time_column, Integer)
+    return cast(func.strftime("%s", time_column), Integer)
+
+
+def _fetch_columns(db, sensor_ids, start_dt, end_dt, ordered=False):
+    """Измерения сенсоров за [start_dt, end_dt) тремя массивами NumPy:
+    sensor_id (int64), ts (int64, секунды от эпохи), value (float64, NaN).
+
+    Время выбирается из SQLite уже целым числом, без объектов datetime и ORM.
+    """
+    if archived_in_range(start_dt, end_dt):
+        table = merged_table(db, sensor_ids, start_dt, end_dt)
+        columns = [
+            table[name].to_numpy().astype(dtype)
+            for name, dtype in (
+                ("sensor_id", np.int64),
+                ("ts", np.int64),
+                ("value", np.float64),
+            )
+        ]
+        if ordered:
+            order = np.lexsort((columns[1], columns[0]))
+            columns = [c[order] for c in columns]
+        return columns
+    M = measurement_source(db, start_dt, end_dt)
+    query = select(M.sensor_id, epoch_expr(M.measurement_time), M.value).where(
+        M.sensor_id.in_(list(sensor_ids))
+    )
+    if start_dt:
+        query = query.where(M.measurement_time >= start_dt)
+    if end_dt:
+        query = query.where(M.measurement_time < end_dt)
+    if ordered:
+        query = query.order_by(M.sensor_id, M.measurement_time)
+    # Row -> tuple: иначе NumPy разбирает каждый Row как объект-последовательность;
+    # None в столбце value превращается в NaN
+    data = np.array(list(map(tuple, db.execute(query))), dtype=np.float64)
+    data = data.reshape(-1, 3)
+    return data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), data[:, 2]
+
+
+def fetch_series(db, sensor_id, start_dt=None, end_dt=None):
+    """Измерения сенсора по возрастанию времени: Series(time, values)."""
+    _, ts, values = _fetch_columns(db, [sensor_id], start_dt, end_dt, ordered=True)
+    return Series(ts.astype("datetime64[s]"), values)
+
+
+def fetch_matrix(db, sensor_ids, start_dt=None, end_dt=None):
+    """Измерения нескольких сенсоров, выровненные по времени (SensorMatrix)."""
+    sensor_ids = list(sensor_ids)
+    if not sensor_ids:
+        return SensorMatrix(
+            np.array([], dtype="datetime64[s]"), np.empty((0, 0)), sensor_ids
+        )
+    ids, ts, values = _fetch_columns(db, sensor_ids, start_dt, end_dt)
+    time, row = np.unique(ts, return_inverse=True)
+    order = np.argsort(sensor_ids)
+    col = order[np.searchsorted(np.asarray(sensor_ids)[order], ids)]
+    matrix = np.full((len(time), len(sensor_ids)), np.nan)
+    matrix[row, col] = values
+    return SensorMatrix(time.astype("datetime64[s]"), matrix, sensor_ids)
+
+
+def bucket_epoch_expr(time_column, interval_minutes):
+    """SQL-выражение начала интервала в секундах от эпохи."""
+    step = int(interval_minutes) * 60
+    return (epoch_expr(time_column) // step) * step
+
+
+def _raw_aggregate_query(
+    db, sensor_id, start_dt, end_dt, interval_minutes, agg, by_sensor=False
+):
+    M = measurement_source(db, start_dt, end_dt)
+    bucket = bucket_epoch_expr(M.measurement_time, interval_minutes)
+    keys = [M.sensor_id, bucket] if by_sensor else [bucket]
+    query = db.query(*keys, SQL_AGGREGATES[agg](M.value)).filter(M.value.isnot(None))
+    if isinstance(sensor_id, (list, tuple, set)):
+        query = query.filter(M.sensor_id.in_(list(sensor_id)))
+    elif sensor_id is not None:
+        query = query.filter(M.sensor_id == sensor_id)
+    if start_dt:
+        query = query.filter(M.measurement_time >= start_dt)
+    if end_dt:
+        query = query.filter(M.measurement_time < end_dt)
+    return query.group_by(*keys).order_by(*keys)
+
+
+def _rollup_aggregate_query(
+    db, resolution, sensor_id, start_dt, end_dt, interval_minutes, agg, by_sensor=False
+):
+    step = int(interval_minutes) * 60
+    bucket = (MeasurementRollup.bucket_start // step) * step
+    value = {
+        "avg": func.sum(MeasurementRollup.value_sum)
+        / func.sum(MeasurementRollup.value_count),
+        "sum": func.sum(MeasurementRollup.value_sum),
+        "min": func.min(MeasurementRollup.value_min),
+        "max": func.max(MeasurementRollup.value_max),
+        "count": func.sum(MeasurementRollup.value_count),
+    }[agg]
+    keys = [MeasurementRollup.sensor_id, bucket] if by_sensor else [bucket]
+    query = db.query(*keys, value).filter(MeasurementRollup.resolution == resolution)
+    if isinstance(sensor_id, (list, tuple, set)):
+        query = query.filter(MeasurementRollup.sensor_id.in_(list(sensor_id)))
+    elif sensor_id is not None:
+        query = query.filter(MeasurementRollup.sensor_id == sensor_id)
+    if start_dt:
+        query = query.filter(MeasurementRollup.bucket_start >= to_epoch(start_dt))
+    if end_dt:
+        query = query.filter(MeasurementRollup.bucket_start < to_epoch(end_dt))
+    return query.group_by(*keys).order_by(*keys)
+
+
+def aggregate_query(
+    db, sensor_id, start_dt, end_dt, interval_minutes, agg="avg", by_sensor=False
+):
+    """Запрос агрегатов по интервалам: из measurement_rollups, если разрешение
+    подходит к интервалу и границам, иначе из сырых измерений.
+
+    Строки — (bucket, value) или при by_sensor=True (sensor_id, bucket, value),
+    bucket — начало интервала в секундах от эпохи.
+    """
+    resolution = pick_rollup_resolution(interval_minutes, start_dt, end_dt)
+    if resolution is not None:
+        return _rollup_aggregate_query(
+            db,
+            resolution,
+            sensor_id,
+            start_dt,
+            end_dt,
+            interval_minutes,
+            agg,
+            by_sensor,
         )
-        .all()
+    return _raw_aggregate_query(
+        db, sensor_id, start_dt, end_dt, interval_minutes, agg, by_sensor
     )
 
-    time_group = defaultdict(list)
-    for m in all_data:
-        time_group[m.measurement_time].append(m.value)
-
-    avg_data = []
-    for t, vals in time_group.items():
-        valid_vals = [v for v in vals if v is not None]
-        if valid_vals:
-            avg = sum(valid_vals) / len(valid_vals)
-            avg_data.append(type("Obj", (), {"measurement_time": t, "value": avg}))
-    return avg_data
 
+def aggregate_rows(
+    db, sensor_id, start_dt, end_dt, interval_minutes, agg="avg", by_sensor=False
+):
+    """Строки aggregate_query; если готовые агрегаты не подходят, а диапазон
+    задевает Parquet-архив, — агрегаты по архиву и SQLite (archive.py)."""
+    if pick_rollup_resolution(
+        interval_minutes, start_dt, end_dt
+    ) is None and archived_in_range(start_dt, end_dt):
+        return aggregate_archive(
+            db, sensor_id, start_dt, end_dt, interval_minutes, agg, by_sensor
+        )
+    return aggregate_query(
+        db, sensor_id, start_dt, end_dt, interval_minutes, agg, by_sensor
+    ).all()
 
-def group_measurements(measurements, interval_minutes):
 
-    grouped = defaultdict(list)
-    for m in measurements:
-        dt = m.measurement_time
-        if m.value is not None:
-            minute_bucket = (dt.minute // interval_minutes) * interval_minutes
-            dt_group = dt.replace(minute=minute_bucket, second=0, microsecond=0)
-            grouped[dt_group].append(m.value)
+def aggregate_measurements(
+    db, sensor_id, start_dt=None, end_dt=None, interval_minutes=15, agg="avg"
+):
+    """Группирует измерения по интервалам на стороне SQLite.
 
-    return {dt: sum(vals) / len(vals) for dt, vals in grouped.items() if vals}
+    Если интервал и границы диапазона кратны одному из разрешений
+    measurement_rollups, читаются готовые агрегаты, иначе сырые измерения.
+    sensor_id — id, список id или None (все сенсоры). Возвращает список
+    DataPoint(measurement_time, value), упорядоченный по времени.
+    """
+    try:
+        rows = aggregate_rows(db, sensor_id, start_dt, end_dt, interval_minutes, agg)
+        return [
+            DataPoint(EPOCH + timedelta(seconds=b), value)
+            for b, value in rows
+            if b is not None
+        ]
+    except Exception as e:
+        logger.error(
+            "Error in aggregate_measurements for sensor %s: %s",
+            sensor_id,
+            e,
+            exc_info=True,
+        )
+        raise
 
 
 def save_virtual_averages(db, start_time, end_time):
     for virtual_name, source_names in VIRTUAL_SENSOR_GROUPS.items():
-        virtual_sensor = db.query(Sensor).filter_by(sensor_name=virtual_name).first()
+        virtual_sensor = sensor_registry.get_by_name(db, virtual_name)
         if not virtual_sensor:
             print(f"Виртуальный сенсор {virtual_name} не найден.")
             continue
 
-        sensors = db.query(Sensor).filter(Sensor.sensor_name.in_(source_names)).all()
+        sensors = [sensor_registry.get_by_name(db, name) for name in source_names]
         sensor_ids = [s.sensor_id for s in sensors if s]
         if len(sensor_ids) != len(source_names):
             print(f"Не все сенсоры группы найдены для {virtual_name}")
             continue
 
+        M = measurement_source(db, start_time, end_time)
         rows = (
-            db.query(
-                Measurement.measurement_time, Measurement.value, Measurement.sensor_id
-            )
+            db.query(M.measurement_time, M.value, M.sensor_id)
             .filter(
-                Measurement.sensor_id.in_(sensor_ids),
-                Measurement.measurement_time.between(start_time, end_time),
+                M.sensor_id.in_(sensor_ids),
+                M.measurement_time.between(start_time, end_time),
             )
             .all()
         )
@@ -452,19 +765,19 @@ def save_virtual_averages(db, start_time, end_time):
         df["time"] = pd.to_datetime(df["time"])
         avg_df = df.groupby("time")["value"].mean().reset_index()
         avg_df["value"] = avg_df["value"].round(2)
-        for _, row in avg_df.iterrows():
-            stmt = (
-                sqlite_insert(Measurement)
-                .values(
-                    sensor_id=virtual_sensor.sensor_id,
-                    measurement_time=row["time"],
-                    value=row["value"],
-                )
-                .on_conflict_do_update(
-                    index_elements=["sensor_id", "measurement_time"],
-                    set_={"value": row["value"]},
+        bulk_upsert_measurements(
+            db,
+            [
+                {
+                    "sensor_id": virtual_sensor.sensor_id,
+                    "measurement_time": t,
+                    "value": value,
+                }
+                for t, value in zip(
+                    pd.DatetimeIndex(avg_df["time"]).to_pydatetime(),
+                    avg_df["value"].to_numpy(),
                 )
-            )
-            db.execute(stmt)
+            ],
+        )
 
     print("Средние значения для виртуальных сенсоров успешно сохранены.")
@@ -3,32 +3,48 @@ import pandas as pd
 import csv
 import io
 import os
+import tempfile
 import logging
 from dotenv import load_dotenv
 from sqlite3 import IntegrityError
 from db_session import SessionLocal
-from init_db import Sensor, Measurement, User
+from init_db import Sensor, User
 from datetime import date, datetime, timedelta
 from flask import Flask, request, render_template, redirect, url_for
-from sqlalchemy.dialects.sqlite import insert as sqlite_insert
-from flask import session, flash, make_response
+from flask import session, flash, Response, send_file, stream_with_context
 from openpyxl import Workbook
 from openpyxl.utils import get_column_letter
 from functools import wraps
+from itertools import chain, islice
 from sensor_labels import SENSOR_LABELS, UNIT_LABELS
+from sensor_registry import sensor_registry
+from rollups import check_rollups, mark_rollups_dirty
+from partitions import delete_range, measurement_source, reassign_sensor
+from archive import (
+    ArchivedDataError,
+    archived_sensor_months,
+    count_archived,
+    require_not_archived,
+)
+from forecast_publish import publish_forecast
 from collections import defaultdict
 from comparison_utils import (
-    get_common_time_series,
-    get_measurements,
     get_sensor_names,
     handle_uploaded_file,
     parse_date_range,
+    aggregate_measurements,
     group_measurements,
     save_virtual_averages,
     get_avg_measurements_for_all,
+    iter_measurements,
+    merge_time_series,
+    comparison_row,
 )
 
 
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXCEL_WIDTH_SAMPLE_ROWS = 1000
+
 load_dotenv()
 app = Flask(__name__)
 secret = os.getenv("SECRET_KEY")
@@ -46,6 +62,12 @@ logger.setLevel(logging.INFO)
 logger.addHandler(handler)
 
 
+# агрегаты строятся отдельным шагом (python rollups.py --if-missing в restart.sh),
+# воркер только проверяет их наличие
+with SessionLocal() as db:
+    check_rollups(db)
+
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -169,12 +191,8 @@ def upload_forecast():
             filename_lower = file.filename.lower()
             if "energy" in filename_lower:
                 sensor_name = "Forecast Energy"
-                sensor_type = "energy_active"
-                unit = "kWh"
             elif "irrad" in filename_lower:
                 sensor_name = "Forecast Radiation"
-                sensor_type = "radiation"
-                unit = "W/m2"
             else:
                 print(
                     f"Пропущен файл: {file.filename} — не содержит 'energy' или 'irrad'"
@@ -209,35 +227,21 @@ def upload_forecast():
             except Exception:
                 forecast_date = datetime.today().date()
 
-            sensor = db.query(Sensor).filter_by(sensor_name=sensor_name).first()
-            if sensor:
-                sensor_id = sensor.sensor_id
-            else:
-                sensor = Sensor(
-                    sensor_name=sensor_name, sensor_type=sensor_type, unit=unit
+            times = pd.to_datetime(
+                forecast_date.isoformat() + " " + df["time"].astype(str).str.strip(),
+                format="%Y-%m-%d %H:%M:%S",
+                errors="coerce",
+            )
+            try:
+                inserted = publish_forecast(db, sensor_name, times, df["radiation"])
+            except ArchivedDataError as e:
+                db.rollback()
+                return f"Прогноз из {file.filename} не загружен: {e}", 409
+            if inserted < len(df):
+                print(
+                    f"Ошибка прогноза в {file.filename}: пропущено строк {len(df) - inserted}"
                 )
-                db.add(sensor)
-                db.flush()
-                sensor_id = sensor.sensor_id
-
-            for _, row in df.iterrows():
-                try:
-                    time_obj = datetime.strptime(row["time"], "%H:%M:%S").time()
-                    dt = datetime.combine(forecast_date, time_obj)
-                    value = float(row["radiation"])
-
-                    stmt = (
-                        sqlite_insert(Measurement)
-                        .values(sensor_id=sensor_id, measurement_time=dt, value=value)
-                        .on_conflict_do_update(
-                            index_elements=["sensor_id", "measurement_time"],
-                            set_={"value": value},
-                        )
-                    )
-                    db.execute(stmt)
-                    total_inserted += 1
-                except Exception as e:
-                    print(f"Ошибка прогноза в строке: {e}")
+            total_inserted += inserted
 
         try:
             db.commit()
@@ -252,9 +256,7 @@ def upload_forecast():
 @login_required
 def show_sensors():
     with SessionLocal() as db:
-        sensors = (
-            db.query(Sensor).filter_by(visible=True).order_by(Sensor.sensor_id).all()
-        )
+        sensors = [s for s in sensor_registry.all(db) if s.visible]
     return render_template("sensors.html", sensors=sensors)
 
 
@@ -273,24 +275,23 @@ def show_data():
         )
 
     with SessionLocal() as db:
-        sensors = db.query(Sensor).filter_by(visible=True).all()
-        query = db.query(Measurement)
-        if selected_sensor_id and selected_sensor_id.isdigit():
-            query = query.filter(Measurement.sensor_id == int(selected_sensor_id))
-
+        sensors = [s for s in sensor_registry.all(db) if s.visible]
+        sensor_id = (
+            int(selected_sensor_id)
+            if selected_sensor_id and selected_sensor_id.isdigit()
+            else None
+        )
         start_dt, end_dt = parse_date_range(start_date, end_date)
-
-        if start_dt is not None:
-            query = query.filter(Measurement.measurement_time >= start_dt)
-
         if end_dt is not None:
-            query = query.filter(Measurement.measurement_time <= end_dt)
+            end_dt += timedelta(seconds=1)
 
-        measurements = query.order_by(Measurement.measurement_time).all()
-
-        grouped = group_measurements(measurements, interval)
-        chart_labels = [dt.strftime("%Y-%m-%d %H:%M") for dt in sorted(grouped)]
-        chart_values = [grouped[dt] for dt in sorted(grouped)]
+        measurements = aggregate_measurements(
+            db, sensor_id, start_dt, end_dt, interval
+        )
+        chart_labels = [
+            m.measurement_time.strftime("%Y-%m-%d %H:%M") for m in measurements
+        ]
+        chart_values = [m.value for m in measurements]
 
     return render_template(
         "data.html",
@@ -313,24 +314,20 @@ def get_data():
     interval = int(request.args.get("interval", 15))
 
     with SessionLocal() as db:
-        sensors = db.query(Sensor).filter_by(visible=True).all()
-        query = db.query(Measurement)
-        if selected_sensor_id and selected_sensor_id.isdigit():
-            query = query.filter(Measurement.sensor_id == int(selected_sensor_id))
-
+        sensor_id = (
+            int(selected_sensor_id)
+            if selected_sensor_id and selected_sensor_id.isdigit()
+            else None
+        )
         start_dt, end_dt = parse_date_range(start_date, end_date)
-
-        if start_dt is not None:
-            query = query.filter(Measurement.measurement_time >= start_dt)
-
         if end_dt is not None:
-            query = query.filter(Measurement.measurement_time <= end_dt)
-
-        measurements = query.order_by(Measurement.measurement_time).all()
+            end_dt += timedelta(seconds=1)
 
-        grouped = group_measurements(measurements, interval)
-        time_values = [dt.strftime("%Y-%m-%d %H:%M:%S") for dt in sorted(grouped)]
-        values = [grouped[dt] for dt in sorted(grouped)]
+        grouped = aggregate_measurements(db, sensor_id, start_dt, end_dt, interval)
+        time_values = [
+            m.measurement_time.strftime("%Y-%m-%d %H:%M:%S") for m in grouped
+        ]
+        values = [m.value for m in grouped]
 
     return {
         'start_date': start_date,
@@ -352,27 +349,21 @@ def compare_select():
             [data_type, "virtual"] if data_type == "radiation" else [data_type]
         )
 
-        sensors_actual = (
-            db.query(Sensor)
-            .filter(
-                ~Sensor.sensor_name.ilike("%forecast%"),
-                Sensor.visible == True,
-                Sensor.sensor_type.in_(actual_type_filter),
-            )
-            .order_by(Sensor.sensor_name)
-            .all()
-        )
-
-        sensors_forecast = (
-            db.query(Sensor)
-            .filter(
-                Sensor.sensor_name.ilike("%forecast%"),
-                Sensor.visible == True,
-                Sensor.sensor_type == data_type,
-            )
-            .order_by(Sensor.sensor_name)
-            .all()
+        sensors = sorted(
+            (s for s in sensor_registry.all(db) if s.visible),
+            key=lambda s: s.sensor_name,
         )
+        sensors_actual = [
+            s
+            for s in sensors
+            if "forecast" not in s.sensor_name.lower()
+            and s.sensor_type in actual_type_filter
+        ]
+        sensors_forecast = [
+            s
+            for s in sensors
+            if "forecast" in s.sensor_name.lower() and s.sensor_type == data_type
+        ]
 
     return render_template(
         "compare_select.html",
@@ -405,11 +396,12 @@ def compare():
                 db, actual_id, forecast_id
             )
 
-            actual_data = get_measurements(db, actual_id, start_dt, end_dt)
-            forecast_data = get_measurements(db, forecast_id, start_dt, end_dt)
-
-            grouped_actual = group_measurements(actual_data, interval)
-            grouped_forecast = group_measurements(forecast_data, interval)
+            grouped_actual = dict(
+                aggregate_measurements(db, actual_id, start_dt, end_dt, interval)
+            )
+            grouped_forecast = dict(
+                aggregate_measurements(db, forecast_id, start_dt, end_dt, interval)
+            )
 
             all_times = sorted(
                 set(grouped_actual.keys()).union(grouped_forecast.keys())
@@ -464,64 +456,35 @@ def compare_table():
         else:
             end_dt = start_dt + timedelta(days=1)
 
-        actual_name = (
-            "Среднее"
-            if sensor_actual_id == -1
-            else db.get(Sensor, sensor_actual_id).sensor_name
-        )
         actual_name, forecast_name, actual_unit, forecast_unit = get_sensor_names(
             db, sensor_actual_id, sensor_forecast_id
         )
 
         if sensor_actual_id == -1:
-            actual_data = get_avg_measurements_for_all(db, start_dt, end_dt)
+            actual_buckets = group_measurements(
+                get_avg_measurements_for_all(db, start_dt, end_dt), interval
+            )
         else:
-            actual_data = (
-                db.query(Measurement)
-                .filter(
-                    Measurement.sensor_id == sensor_actual_id,
-                    Measurement.measurement_time >= start_dt,
-                    Measurement.measurement_time < end_dt,
+            actual_buckets = dict(
+                aggregate_measurements(
+                    db, sensor_actual_id, start_dt, end_dt, interval
                 )
-                .order_by(Measurement.measurement_time)
-                .all()
             )
-
-        forecast_data = (
-            db.query(Measurement)
-            .filter(
-                Measurement.sensor_id == sensor_forecast_id,
-                Measurement.measurement_time >= start_dt,
-                Measurement.measurement_time < end_dt,
-            )
-            .order_by(Measurement.measurement_time)
-            .all()
+        forecast_buckets = dict(
+            aggregate_measurements(db, sensor_forecast_id, start_dt, end_dt, interval)
         )
 
-    def bucket_time(dt, interval):
-        minute_bucket = (dt.minute // interval) * interval
-        return dt.replace(minute=minute_bucket, second=0, microsecond=0)
-
-    actual_buckets = defaultdict(list)
-    forecast_buckets = defaultdict(list)
-    for m in actual_data:
-        b_time = bucket_time(m.measurement_time, interval)
-        actual_buckets[b_time].append(m.value)
-    for m in forecast_data:
-        b_time = bucket_time(m.measurement_time, interval)
-        forecast_buckets[b_time].append(m.value)
-
     all_buckets = sorted(set(actual_buckets.keys()) | set(forecast_buckets.keys()))
 
     grouped_rows = defaultdict(list)
     daily_totals = []
 
     for b_time in all_buckets:
-        a_vals = actual_buckets.get(b_time, [])
-        f_vals = forecast_buckets.get(b_time, [])
+        a_avg = actual_buckets.get(b_time)
+        f_avg = forecast_buckets.get(b_time)
 
-        a_avg = round(sum(a_vals) / len(a_vals), 3) if a_vals else ""
-        f_avg = round(sum(f_vals) / len(f_vals), 3) if f_vals else ""
+        a_avg = round(a_avg, 3) if a_avg is not None else ""
+        f_avg = round(f_avg, 3) if f_avg is not None else ""
 
         a_avg = a_avg if isinstance(a_avg, (int, float)) and a_avg > 0 else 0
         f_avg = f_avg if isinstance(f_avg, (int, float)) and f_avg > 0 else 0
@@ -597,7 +560,6 @@ def compare_table():
 
 @app.route("/compare_table/export")
 def export_compare_table():
-    db = SessionLocal()
     actual_id = int(request.args.get("sensor_actual_id"))
     forecast_id = int(request.args.get("sensor_forecast_id"))
     start_date = datetime.strptime(request.args.get("start_date"), "%Y-%m-%d")
@@ -605,32 +567,31 @@ def export_compare_table():
         days=1
     )
 
-    actual_data = get_measurements(db, actual_id, start_date, end_date)
-    forecast_data = get_measurements(db, forecast_id, start_date, end_date)
-    labels, actual_dict, forecast_dict = get_common_time_series(
-        actual_data, forecast_data
-    )
-
-    buffer = io.StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow(["Время", "Факт", "Прогноз", "Ошибка", "Ошибка (%)"])
-
-    for t in labels:
-        a = actual_dict.get(t)
-        f = forecast_dict.get(t)
-        diff = (a - f) if a is not None and f is not None else ""
-        percent = (abs(diff) / a * 100) if a and f else ""
-        writer.writerow([t.strftime("%Y-%m-%d %H:%M:%S"), a, f, diff, percent])
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["Время", "Факт", "Прогноз", "Ошибка", "Ошибка (%)"])
 
-    response = make_response(buffer.getvalue())
+        with SessionLocal() as db:
+            rows = merge_time_series(
+                iter_measurements(db, actual_id, start_date, end_date),
+                iter_measurements(db, forecast_id, start_date, end_date),
+            )
+            for t, a, f in rows:
+                writer.writerow(comparison_row(t, a, f))
+                if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+        yield buffer.getvalue()
+
+    response = Response(stream_with_context(generate()), mimetype="text/csv")
     response.headers["Content-Disposition"] = "attachment; filename=comparison.csv"
-    response.headers["Content-type"] = "text/csv"
     return response
 
 
 @app.route("/compare_table/export_excel")
 def export_compare_table_excel():
-    db = SessionLocal()
     actual_id = int(request.args.get("sensor_actual_id"))
     forecast_id = int(request.args.get("sensor_forecast_id"))
     start_date = datetime.strptime(request.args.get("start_date"), "%Y-%m-%d")
@@ -638,49 +599,48 @@ def export_compare_table_excel():
         days=1
     )
 
-    actual_data = get_measurements(db, actual_id, start_date, end_date)
-    forecast_data = get_measurements(db, forecast_id, start_date, end_date)
-    labels, actual_dict, forecast_dict = get_common_time_series(
-        actual_data, forecast_data
-    )
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Сравнение"
-
-    ws.append(["Время", "Факт", "Прогноз", "Ошибка", "Ошибка (%)"])
+    header = ["Время", "Факт", "Прогноз", "Ошибка", "Ошибка (%)"]
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Сравнение")
 
-    for t in labels:
-        a = actual_dict.get(t)
-        f = forecast_dict.get(t)
-        diff = (a - f) if a is not None and f is not None else ""
-        percent = (abs(diff) / a * 100) if a and f else ""
-        ws.append(
-            [
-                t.strftime("%Y-%m-%d %H:%M:%S"),
+    def excel_rows(rows):
+        for t, a, f in rows:
+            time_str, a, f, diff, percent = comparison_row(t, a, f)
+            yield [
+                time_str,
                 a if a is not None else "",
                 f if f is not None else "",
-                diff if diff != "" else "",
+                diff,
                 round(percent, 2) if percent != "" else "",
             ]
-        )
 
-    for col in ws.columns:
-        max_len = max(
-            len(str(cell.value)) if cell.value is not None else 0 for cell in col
+    with SessionLocal() as db:
+        rows = excel_rows(
+            merge_time_series(
+                iter_measurements(db, actual_id, start_date, end_date),
+                iter_measurements(db, forecast_id, start_date, end_date),
+            )
         )
-        ws.column_dimensions[get_column_letter(col[0].column)].width = max_len + 2
+        # В режиме write_only ширины задаются до первой строки — по выборке
+        sample = list(islice(rows, EXCEL_WIDTH_SAMPLE_ROWS))
+        for i, col in enumerate(zip(header, *sample), start=1):
+            max_len = max(len(str(value)) for value in col)
+            ws.column_dimensions[get_column_letter(i)].width = max_len + 2
+
+        ws.append(header)
+        for row in chain(sample, rows):
+            ws.append(row)
 
-    buffer = io.BytesIO()
+    buffer = tempfile.TemporaryFile()
     wb.save(buffer)
     buffer.seek(0)
 
-    response = make_response(buffer.read())
-    response.headers["Content-Disposition"] = "attachment; filename=comparison.xlsx"
-    response.headers["Content-type"] = (
-        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    return send_file(
+        buffer,
+        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        as_attachment=True,
+        download_name="comparison.xlsx",
     )
-    return response
 
 
 @app.route("/admin/sensors", methods=["GET", "POST"])
@@ -713,21 +673,22 @@ def admin_sensors():
                     try:
                         target_id = int(merge_target_id)
                         if target_id in id_to_sensor:
-                            db.query(Measurement).filter(
-                                Measurement.sensor_id == sid
-                            ).update({Measurement.sensor_id: target_id})
+                            require_not_archived([sid])
+                            reassign_sensor(db, sid, target_id)
+                            mark_rollups_dirty(db, [sid, target_id])
                             db.delete(sensor)
                     except Exception as e:
                         db.rollback()
+                        sensor_registry.invalidate()
                         flash(f"Ошибка переноса сенсора ID {sid}: {e}", "danger")
                         return redirect(url_for("admin_sensors"))
 
             for sid in delete_ids:
                 if sid in id_to_sensor:
-                    measurement_count = (
-                        db.query(Measurement).filter_by(sensor_id=sid).count()
-                    )
-                    if measurement_count > 0:
+                    M = measurement_source(db)
+                    measurement_count = db.query(M).filter(M.sensor_id == sid).count()
+                    measurement_count += count_archived([sid])
+                    if measurement_count > 0 or archived_sensor_months([sid]):
                         flash(
                             f"Сенсор ID {sid} не был удалён: по нему есть данные ({measurement_count} измерений)",
                             "danger",
@@ -736,6 +697,7 @@ def admin_sensors():
                         db.delete(id_to_sensor[sid])
 
             db.commit()
+            sensor_registry.invalidate()
             flash("Изменения успешно сохранены.", "success")
             return redirect(url_for("admin_sensors"))
 
@@ -766,15 +728,22 @@ def delete_measurements():
 
     start_dt, end_dt = parse_date_range(start_date, end_date)
 
-    with SessionLocal() as db:
-        query = db.query(Measurement).filter(Measurement.sensor_id == sensor_id)
-
-        if start_dt:
-            query = query.filter(Measurement.measurement_time >= start_dt)
-        if end_dt:
-            query = query.filter(Measurement.measurement_time <= end_dt)
+    try:
+        require_not_archived([sensor_id], start_dt, end_dt)
+    except ArchivedDataError as e:
+        flash(f"Измерения не удалены: {e}", "danger")
+        return redirect(
+            url_for(
+                "show_data",
+                sensor_id=sensor_id,
+                start_date=start_date,
+                end_date=end_date,
+            )
+        )
 
-        deleted_rows = query.delete(synchronize_session=False)
+    with SessionLocal() as db:
+        deleted_rows = delete_range(db, [sensor_id], start_dt, end_dt, end_inclusive=True)
+        mark_rollups_dirty(db, [sensor_id], start_dt, end_dt)
         db.commit()
 
     logger.info(
@@ -1,9 +1,82 @@
 import os
-from sqlalchemy import create_engine
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
+load_dotenv()
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 DB_PATH = f"sqlite:///{os.path.join(BASE_DIR, 'burnoe.db')}"
-engine = create_engine(DB_PATH, echo=False)
+
+# Профили настроек SQLite, применяются к каждому новому соединению.
+# "default" — настройки SQLite по умолчанию (rollback journal, synchronous=FULL).
+# "wal" — читатели не блокируются записью: WAL, synchronous=NORMAL,
+# кэш 64 МиБ, mmap 256 МиБ, временные таблицы в памяти, ожидание блокировки 30 с.
+DB_PROFILES = {
+    "default": {},
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "busy_timeout": 30000,
+    },
+}
+
+# Схема хранения измерений (см. init_db.Measurement и migrate_storage.py):
+# "classic" — measurement_time DateTime (текст ISO) и суррогатный ключ,
+# "compact" — целые секунды от эпохи в WITHOUT ROWID-таблице с ключом (sensor_id, ts)
+STORAGE_LAYOUTS = ("classic", "compact")
+STORAGE_LAYOUT = os.getenv("DB_STORAGE", "classic")
+if STORAGE_LAYOUT not in STORAGE_LAYOUTS:
+    raise ValueError(f"Неизвестная схема хранения: {STORAGE_LAYOUT}")
+
+# Помесячные разделы измерений (см. partitions.py): "monthly" или пусто
+PARTITIONED = os.getenv("DB_PARTITIONS", "") == "monthly"
+
+# Размер пула соединений: по числу потоков gunicorn (--threads 8)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))
+
+
+def profile_pragmas(profile=None):
+    """PRAGMA профиля profile (по умолчанию DB_PROFILE из окружения, иначе "wal").
+
+    Отдельные значения переопределяются переменными SQLITE_<PRAGMA>,
+    например SQLITE_CACHE_SIZE=-131072.
+    """
+    profile = profile or os.getenv("DB_PROFILE", "wal")
+    if profile not in DB_PROFILES:
+        raise ValueError(f"Неизвестный профиль БД: {profile}")
+    pragmas = dict(DB_PROFILES[profile])
+    for name in DB_PROFILES["wal"]:
+        value = os.getenv(f"SQLITE_{name.upper()}")
+        if value is not None:
+            pragmas[name] = value
+    return pragmas
+
+
+def make_engine(url=DB_PATH, profile=None, pool_size=POOL_SIZE):
+    """Engine SQLite с PRAGMA профиля, выставляемыми при каждом подключении."""
+    pragmas = profile_pragmas(profile)
+    engine = create_engine(
+        url,
+        echo=False,
+        pool_size=pool_size,
+        max_overflow=pool_size,
+        connect_args={"check_same_thread": False},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+engine = make_engine()
 SessionLocal = sessionmaker(bind=engine)
@@ -1,6 +1,8 @@
 from sqlalchemy import select, func, delete
 from db_session import SessionLocal
-from init_db import Sensor, Measurement
+from init_db import Sensor
+from partitions import measurement_tables
+from rollups import mark_rollups_dirty
 
 
 def delete_incomplete_measurements():
@@ -20,25 +22,28 @@ def delete_incomplete_measurements():
         forecast_id = next(s.sensor_id for s in sensors if s.sensor_name == "Forecast Radiation")
         pyrano_id = next(s.sensor_id for s in sensors if s.sensor_name == "T-1 Активная энергия, отдача")
 
-        # --- 2. Находим временные метки, где есть оба сенсора ---
-        valid_times_subq = (
-            session.query(Measurement.measurement_time)
-            .filter(Measurement.sensor_id.in_([forecast_id, pyrano_id]))
-            .group_by(Measurement.measurement_time)
-            .having(func.count(Measurement.sensor_id) == 2)
-            .subquery()
-        )
-
-        # --- 3. Удаляем измерения, где времени нет в valid_times ---
-        stmt = (
-            delete(Measurement)
-            .where(Measurement.measurement_time.not_in(select(valid_times_subq.c.measurement_time)))
-        )
-
-        result = session.execute(stmt)
+        # --- 2-3. В каждой таблице измерений (разделе) удаляем измерения,
+        # время которых не встречается у обоих сенсоров ---
+        deleted = 0
+        for table in measurement_tables(session):
+            valid_times_subq = (
+                select(table.c.measurement_time)
+                .where(table.c.sensor_id.in_([forecast_id, pyrano_id]))
+                .group_by(table.c.measurement_time)
+                .having(func.count(table.c.sensor_id) == 2)
+                .subquery()
+            )
+            stmt = (
+                delete(table)
+                .where(table.c.measurement_time.not_in(select(valid_times_subq.c.measurement_time)))
+            )
+            deleted += session.execute(stmt).rowcount
+
+        # --- 4. Пересчитываем агрегаты всех сенсоров ---
+        mark_rollups_dirty(session)
         session.commit()
 
-        print(f"✅ Удалено записей: {result.rowcount}")
+        print(f"✅ Удалено записей: {deleted}")
 
     except Exception as e:
         session.rollback()
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from db_session import SessionLocal
+from comparison_utils import (
+    bulk_upsert_measurements,
+    determine_sensor_type_and_unit,
+    get_sensor_id,
+)
+
+# Сенсоры прогнозов: имя -> (тип, единицы)
+FORECAST_SENSORS = {
+    "Forecast Radiation": ("radiation", "W/m2"),
+    "Forecast Energy": ("energy_active", "kWh"),
+}
+
+
+def forecast_records(sensor_id, times, values):
+    """Записи для bulk_upsert_measurements из массивов времени и значений.
+
+    Строки с некорректным временем или нечисловым значением отбрасываются,
+    пропущенное значение записывается как NULL.
+    """
+    raw = pd.Series(np.asarray(values))
+    times = pd.to_datetime(pd.Series(np.asarray(times)), errors="coerce")
+    values = pd.to_numeric(raw, errors="coerce")
+    valid = (times.notna() & ~(values.isna() & raw.notna())).to_numpy()
+    values = values[valid].astype(float)
+    return [
+        {"sensor_id": sensor_id, "measurement_time": t, "value": v}
+        for t, v in zip(
+            pd.DatetimeIndex(times[valid]).to_pydatetime(),
+            values.astype(object).where(values.notna(), None).tolist(),
+        )
+    ]
+
+
+def publish_forecast(db, sensor_name, times, values, sensor_type=None, unit=None):
+    """Записывает ряд прогноза сенсора sensor_name в текущую транзакцию db.
+
+    Сенсор создаётся при отсутствии; тип и единицы по умолчанию берутся из
+    FORECAST_SENSORS, для прочих имён — как у загружаемых файлов
+    (determine_sensor_type_and_unit). Возвращает число записанных значений
+    (commit — за вызывающим).
+    """
+    default_type, default_unit = FORECAST_SENSORS.get(
+        sensor_name
+    ) or determine_sensor_type_and_unit(sensor_name)
+    sensor_id = get_sensor_id(
+        db, sensor_name, sensor_type or default_type, unit or default_unit
+    )
+    return bulk_upsert_measurements(db, forecast_records(sensor_id, times, values))
+
+
+def publish_forecast_frame(
+    db, df, time_col="time", value_col="value", sensor_col="sensor_name"
+):
+    """Записывает DataFrame прогнозов в «длинном» формате (время, значение, сенсор)."""
+    total = 0
+    for sensor_name, group in df.groupby(sensor_col, sort=False):
+        total += publish_forecast(
+            db, sensor_name, group[time_col].to_numpy(), group[value_col].to_numpy()
+        )
+    return total
+
+
+def publish_forecasts(series):
+    """Публикует несколько рядов одной транзакцией в отдельной сессии.
+
+    series — словарь {имя сенсора: (времена, значения)}.
+    """
+    total = 0
+    with SessionLocal() as db:
+        for sensor_name, (times, values) in series.items():
+            total += publish_forecast(db, sensor_name, times, values)
+        db.commit()
+    return total
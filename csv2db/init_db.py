@@ -1,8 +1,10 @@
+from datetime import datetime, timedelta
 from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, UniqueConstraint, Index
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy import Boolean
-from db_session import SessionLocal, engine
+from db_session import SessionLocal, engine, STORAGE_LAYOUT
 from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy import text
 
@@ -18,21 +20,84 @@ class Sensor(Base):
     visible = Column(Boolean, default=True) 
     measurements = relationship("Measurement", back_populates="sensor")
 
-class Measurement(Base):
-    __tablename__ = 'measurements'
+EPOCH = datetime(1970, 1, 1)
 
-    measurement_id = Column(Integer, primary_key=True, autoincrement=True)
-    sensor_id = Column(Integer, ForeignKey('sensors.sensor_id'), nullable=False)
-    measurement_time = Column(DateTime, nullable=False)
-    value = Column(Float)
+class EpochDateTime(TypeDecorator):
+    """datetime, хранимый целыми секундами от эпохи (наивное время, как DateTime)."""
 
-    sensor = relationship("Sensor", back_populates="measurements")
+    impl = Integer
+    cache_ok = True
 
-    __table_args__ = (
-        UniqueConstraint('sensor_id', 'measurement_time', name='unique_sensor_time'),
-        Index('idx_measurements_time', 'measurement_time'),
-        Index('idx_measurements_sensor_time', 'sensor_id', 'measurement_time'),
-    )
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        return (value - EPOCH) // timedelta(seconds=1)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return EPOCH + timedelta(seconds=value)
+
+if STORAGE_LAYOUT == "compact":
+    class Measurement(Base):
+        """Компактная схема: одна B-tree, кластеризованная по (sensor_id, ts)."""
+
+        __tablename__ = 'measurements'
+
+        sensor_id = Column(Integer, ForeignKey('sensors.sensor_id'), primary_key=True)
+        measurement_time = Column('ts', EpochDateTime, key='measurement_time', primary_key=True)
+        value = Column(Float)
+
+        sensor = relationship("Sensor", back_populates="measurements")
+
+        __table_args__ = {'sqlite_with_rowid': False}
+
+    # Колонка времени и её значение в секундах от эпохи для text-SQL
+    MEASUREMENT_TIME_COLUMN = 'ts'
+    MEASUREMENT_EPOCH_SQL = 'ts'
+else:
+    class Measurement(Base):
+        __tablename__ = 'measurements'
+
+        measurement_id = Column(Integer, primary_key=True, autoincrement=True)
+        sensor_id = Column(Integer, ForeignKey('sensors.sensor_id'), nullable=False)
+        measurement_time = Column(DateTime, nullable=False)
+        value = Column(Float)
+
+        sensor = relationship("Sensor", back_populates="measurements")
+
+        __table_args__ = (
+            UniqueConstraint('sensor_id', 'measurement_time', name='unique_sensor_time'),
+            Index('idx_measurements_time', 'measurement_time'),
+            Index('idx_measurements_sensor_time', 'sensor_id', 'measurement_time'),
+        )
+
+    MEASUREMENT_TIME_COLUMN = 'measurement_time'
+    MEASUREMENT_EPOCH_SQL = "CAST(strftime('%s', measurement_time) AS INTEGER)"
+
+class MeasurementRollup(Base):
+    """Агрегаты измерений по интервалам resolution минут (см. rollups.py)."""
+
+    __tablename__ = 'measurement_rollups'
+
+    sensor_id = Column(Integer, ForeignKey('sensors.sensor_id'), primary_key=True)
+    resolution = Column(Integer, primary_key=True)
+    bucket_start = Column(Integer, primary_key=True)  # секунды от эпохи
+    value_sum = Column(Float)
+    value_count = Column(Integer)
+    value_min = Column(Float)
+    value_max = Column(Float)
+    value_last = Column(Float)
+
+class RollupState(Base):
+    """Отметка о том, что measurement_rollups построены целиком (rollups.ensure_rollups)."""
+
+    __tablename__ = 'measurement_rollups_state'
+
+    state_id = Column(Integer, primary_key=True)
+    built_at = Column(DateTime, nullable=False)
 
 class User(Base):
     __tablename__ = 'users'
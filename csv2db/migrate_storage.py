@@ -0,0 +1,138 @@
+"""Перенос таблицы measurements между схемами хранения classic и compact.
+
+python migrate_storage.py compact            # burnoe.db -> компактная схема
+python migrate_storage.py classic --db x.db  # обратно
+
+После переноса приложение запускается с DB_STORAGE=<схема> (см. db_session.py).
+Помесячные разделы measurements_ГГГГ_ММ (partitions.py) переносятся вместе с
+основной таблицей. Агрегаты measurement_rollups хранятся в секундах от эпохи и
+не меняются.
+"""
+
+import argparse
+import os
+from sqlalchemy import inspect, text
+from db_session import DB_PATH, STORAGE_LAYOUTS, make_engine
+from partitions import PARTITION_PREFIX, existing_months, partition_name
+
+# DDL совпадает с init_db.Measurement для соответствующей схемы; {table} —
+# measurements или раздел, {suffix} — суффикс имён индексов раздела (_ГГГГ_ММ)
+LAYOUT_DDL = {
+    "classic": [
+        """
+        CREATE TABLE {table}_new (
+            measurement_id INTEGER NOT NULL,
+            sensor_id INTEGER NOT NULL,
+            measurement_time DATETIME NOT NULL,
+            value FLOAT,
+            PRIMARY KEY (measurement_id),
+            CONSTRAINT unique_sensor_time UNIQUE (sensor_id, measurement_time),
+            FOREIGN KEY(sensor_id) REFERENCES sensors (sensor_id)
+        )
+        """,
+    ],
+    "compact": [
+        """
+        CREATE TABLE {table}_new (
+            sensor_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            value FLOAT,
+            PRIMARY KEY (sensor_id, ts),
+            FOREIGN KEY(sensor_id) REFERENCES sensors (sensor_id)
+        ) WITHOUT ROWID
+        """,
+    ],
+}
+
+LAYOUT_INDEXES = {
+    "classic": [
+        "CREATE INDEX idx_measurements_sensor_time{suffix}"
+        " ON {table} (sensor_id, measurement_time)",
+        "CREATE INDEX idx_measurements_time{suffix} ON {table} (measurement_time)",
+    ],
+    "compact": [],
+}
+
+# Копирование строк; при совпадении секунд (дробные секунды в classic)
+# остаётся последнее по времени значение
+COPY_SQL = {
+    "compact": """
+        INSERT INTO {table}_new (sensor_id, ts, value)
+        SELECT sensor_id, CAST(strftime('%s', measurement_time) AS INTEGER), value
+        FROM {table}
+        WHERE true  -- иначе SQLite не разбирает ON CONFLICT после SELECT
+        ORDER BY sensor_id, measurement_time
+        ON CONFLICT (sensor_id, ts) DO UPDATE SET value = excluded.value
+    """,
+    # формат DATETIME SQLAlchemy: 'YYYY-MM-DD HH:MM:SS.ffffff'
+    "classic": """
+        INSERT INTO {table}_new (sensor_id, measurement_time, value)
+        SELECT sensor_id, strftime('%Y-%m-%d %H:%M:%S.000000', ts, 'unixepoch'), value
+        FROM {table}
+        ORDER BY sensor_id, ts
+    """,
+}
+
+
+def current_layout(conn, table="measurements"):
+    columns = {c["name"] for c in inspect(conn).get_columns(table)}
+    return "compact" if "ts" in columns else "classic"
+
+
+def measurement_table_names(conn):
+    """measurements и все её помесячные разделы."""
+    return ["measurements"] + [partition_name(month) for month in existing_months(conn)]
+
+
+def _migrate_table(conn, table, layout):
+    suffix = "_" + table[len(PARTITION_PREFIX) :] if table != "measurements" else ""
+    fmt = {"table": table, "suffix": suffix}
+    conn.execute(text(f"DROP TABLE IF EXISTS {table}_new"))
+    for ddl in LAYOUT_DDL[layout]:
+        conn.execute(text(ddl.format(**fmt)))
+    conn.execute(text(COPY_SQL[layout].format(**fmt)))
+    conn.execute(text(f"DROP TABLE {table}"))
+    conn.execute(text(f"ALTER TABLE {table}_new RENAME TO {table}"))
+    for ddl in LAYOUT_INDEXES[layout]:
+        conn.execute(text(ddl.format(**fmt)))
+    return conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+
+
+def migrate(engine, layout, vacuum=True):
+    """Перестраивает measurements и её разделы в схеме layout; возвращает
+    число строк."""
+    with engine.begin() as conn:
+        tables = [
+            table
+            for table in measurement_table_names(conn)
+            if current_layout(conn, table) != layout
+        ]
+        if not tables:
+            print(f"Таблица measurements уже в схеме {layout}.")
+            return None
+        rows = sum(_migrate_table(conn, table, layout) for table in tables)
+    if vacuum:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("layout", choices=STORAGE_LAYOUTS)
+    parser.add_argument("--db", help="путь к файлу БД (по умолчанию burnoe.db)")
+    parser.add_argument("--no-vacuum", action="store_true")
+    args = parser.parse_args()
+
+    url = f"sqlite:///{os.path.abspath(args.db)}" if args.db else DB_PATH
+    path = url[len("sqlite:///") :]
+    size_before = os.path.getsize(path)
+    engine = make_engine(url)
+    rows = migrate(engine, args.layout, vacuum=not args.no_vacuum)
+    engine.dispose()
+    if rows is not None:
+        print(
+            f"Перенесено строк: {rows}; размер файла: "
+            f"{size_before / 2**20:.1f} -> {os.path.getsize(path) / 2**20:.1f} МиБ. "
+            f"Запускайте приложение с DB_STORAGE={args.layout}."
+        )
@@ -0,0 +1,69 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+import numpy as np
+from db_session import SessionLocal
+from comparison_utils import aggregate_rows
+from rollups import EPOCH, to_epoch
+
+# time — начала интервалов (datetime64[s], T), values — float64 (T, S) с NaN
+# там, где данных нет, sensor_ids — порядок столбцов values
+Observations = namedtuple("Observations", ["time", "values", "sensor_ids"])
+
+
+def load_observations(
+    db, sensor_ids, start_dt, end_dt, interval_minutes=60, agg="avg"
+):
+    """Агрегаты нескольких сенсоров за период одним запросом.
+
+    Значения раскладываются на регулярную сетку [start_dt, end_dt) с шагом
+    interval_minutes (как /get_data с тем же interval), чтобы их можно было
+    напрямую сопоставлять с признаками GFS по времени.
+    """
+    sensor_ids = list(sensor_ids)
+    step = int(interval_minutes) * 60
+    start_ts = to_epoch(start_dt) // step * step
+    end_ts = -(-to_epoch(end_dt) // step) * step
+    time = np.arange(start_ts, end_ts, step, dtype=np.int64)
+    values = np.full((len(time), len(sensor_ids)), np.nan)
+    if not len(time) or not sensor_ids:
+        return Observations(time.astype("datetime64[s]"), values, sensor_ids)
+
+    rows = aggregate_rows(
+        db,
+        sensor_ids,
+        EPOCH + timedelta(seconds=start_ts),
+        EPOCH + timedelta(seconds=end_ts),
+        interval_minutes,
+        agg,
+        by_sensor=True,
+    )
+    if rows:
+        data = np.array(
+            [(s, b, np.nan if v is None else v) for s, b, v in rows], dtype=np.float64
+        )
+        columns = {sensor_id: i for i, sensor_id in enumerate(sensor_ids)}
+        col = np.array([columns[int(s)] for s in data[:, 0]])
+        row = (data[:, 1].astype(np.int64) - start_ts) // step
+        values[row, col] = data[:, 2]
+    return Observations(time.astype("datetime64[s]"), values, sensor_ids)
+
+
+def fetch_observations(sensor_ids, start_dt, end_dt, interval_minutes=60, agg="avg"):
+    """load_observations в отдельной сессии (для скриптов вне веб-приложения)."""
+    with SessionLocal() as db:
+        return load_observations(
+            db, sensor_ids, start_dt, end_dt, interval_minutes, agg
+        )
+
+
+if __name__ == "__main__":
+    # python observations.py 5 2025-06-01 2025-06-02
+    import sys
+
+    obs = fetch_observations(
+        [int(s) for s in sys.argv[1].split(",")],
+        datetime.strptime(sys.argv[2], "%Y-%m-%d"),
+        datetime.strptime(sys.argv[3], "%Y-%m-%d"),
+    )
+    for t, v in zip(obs.time, obs.values):
+        print(t, v)
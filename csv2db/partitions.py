@@ -0,0 +1,227 @@
+"""Помесячные разделы таблицы measurements (DB_PARTITIONS=monthly).
+
+Измерения месяца хранятся в таблице measurements_ГГГГ_ММ той же схемы, что
+init_db.Measurement (classic или compact). Запросы за период читают только
+разделы, пересекающиеся с ним; удаление старых данных — DROP TABLE раздела,
+освободившиеся страницы переиспользуются новыми разделами без VACUUM.
+
+python partitions.py list
+python partitions.py split                # перенести measurements в разделы
+python partitions.py drop-before 2024-01  # удалить разделы до января 2024
+"""
+
+import re
+import threading
+from datetime import datetime
+from sqlalchemy import MetaData, func, select, text, union_all
+from sqlalchemy.orm import aliased
+from db_session import PARTITIONED
+from init_db import Measurement, Sensor
+
+PARTITION_PREFIX = "measurements_"
+PARTITION_RE = re.compile(r"^measurements_(\d{4})_(\d{2})$")
+
+# Таблицы разделов в отдельных метаданных, чтобы create_all их не создавал
+partition_metadata = MetaData()
+Sensor.__table__.to_metadata(partition_metadata)
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def month_of(dt):
+    return dt.year, dt.month
+
+
+def partition_name(month):
+    year, mon = month
+    return f"{PARTITION_PREFIX}{year:04d}_{mon:02d}"
+
+
+def month_start(month):
+    return datetime(month[0], month[1], 1)
+
+
+def next_month(month):
+    year, mon = month
+    return (year + 1, 1) if mon == 12 else (year, mon + 1)
+
+
+def partition_table(month):
+    """Table раздела (создаётся в метаданных один раз, в БД — ensure_partition)."""
+    name = partition_name(month)
+    with _tables_lock:
+        table = _tables.get(name)
+        if table is None:
+            table = Measurement.__table__.to_metadata(partition_metadata, name=name)
+            # имена индексов в SQLite общие для всей БД
+            for index in table.indexes:
+                index.name = f"{index.name}_{name[len(PARTITION_PREFIX):]}"
+            _tables[name] = table
+        return table
+
+
+def ensure_partition(db, month):
+    table = partition_table(month)
+    table.create(db.connection(), checkfirst=True)
+    return table
+
+
+def existing_months(db):
+    """Месяцы существующих разделов по возрастанию."""
+    names = db.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE :p"),
+        {"p": f"{PARTITION_PREFIX}%"},
+    ).scalars()
+    months = []
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            months.append((int(match.group(1)), int(match.group(2))))
+    return sorted(months)
+
+
+def months_in_range(db, start_dt=None, end_dt=None):
+    """Существующие разделы, пересекающиеся с [start_dt, end_dt]."""
+    return [
+        month
+        for month in existing_months(db)
+        if (start_dt is None or month >= month_of(start_dt))
+        and (end_dt is None or month <= month_of(end_dt))
+    ]
+
+
+def measurement_tables(db, start_dt=None, end_dt=None):
+    """Таблицы измерений за период: разделы или единственная measurements."""
+    if not PARTITIONED:
+        return [Measurement.__table__]
+    return [partition_table(month) for month in months_in_range(db, start_dt, end_dt)]
+
+
+def measurement_source(db, start_dt=None, end_dt=None):
+    """Сущность для ORM-запросов к измерениям за период.
+
+    Без разделов — сам Measurement; с разделами — Measurement, отображённый на
+    UNION ALL подходящих разделов (фильтры запроса SQLite переносит в каждый).
+    """
+    if not PARTITIONED:
+        return Measurement
+    tables = measurement_tables(db, start_dt, end_dt) or [Measurement.__table__]
+    selects = [select(*[c.label(c.name) for c in table.c]) for table in tables]
+    source = (selects[0] if len(selects) == 1 else union_all(*selects)).subquery(
+        Measurement.__tablename__
+    )
+    return aliased(Measurement, source, adapt_on_names=True)
+
+
+def measurement_source_sql(db, start_dt=None, end_dt=None):
+    """measurement_source для text-SQL: имя таблицы или подзапрос UNION ALL."""
+    if not PARTITIONED:
+        return Measurement.__tablename__
+    names = [table.name for table in measurement_tables(db, start_dt, end_dt)]
+    if not names:
+        return Measurement.__tablename__
+    return "(" + " UNION ALL ".join(f"SELECT * FROM {name}" for name in names) + ")"
+
+
+def write_targets(db, records):
+    """(таблица, записи) для вставки: по разделам месяцев или все в measurements."""
+    if not PARTITIONED:
+        return [(Measurement.__table__, records)]
+    groups = {}
+    for r in records:
+        groups.setdefault(month_of(r["measurement_time"]), []).append(r)
+    return [(ensure_partition(db, month), groups[month]) for month in sorted(groups)]
+
+
+def delete_range(db, sensor_ids=None, start_dt=None, end_dt=None, end_inclusive=False):
+    """Удаляет измерения сенсоров за период из затронутых таблиц; число строк."""
+    deleted = 0
+    for table in measurement_tables(db, start_dt, end_dt):
+        stmt = table.delete()
+        if sensor_ids is not None:
+            stmt = stmt.where(table.c.sensor_id.in_(list(sensor_ids)))
+        if start_dt:
+            stmt = stmt.where(table.c.measurement_time >= start_dt)
+        if end_dt:
+            stmt = stmt.where(
+                table.c.measurement_time <= end_dt
+                if end_inclusive
+                else table.c.measurement_time < end_dt
+            )
+        deleted += db.execute(stmt).rowcount
+    return deleted
+
+
+def reassign_sensor(db, sensor_id, target_id):
+    """Переносит все измерения sensor_id на target_id."""
+    for table in measurement_tables(db):
+        db.execute(
+            table.update()
+            .where(table.c.sensor_id == sensor_id)
+            .values(sensor_id=target_id)
+        )
+
+
+def split_measurements(db):
+    """Переносит строки основной таблицы measurements в разделы по месяцам."""
+    base = Measurement.__table__
+    time_col = base.c.measurement_time
+    first, last = db.execute(select(func.min(time_col), func.max(time_col))).one()
+    if first is None:
+        return 0
+    moved = 0
+    month = month_of(first)
+    while month <= month_of(last):
+        in_month = (time_col >= month_start(month)) & (
+            time_col < month_start(next_month(month))
+        )
+        if db.execute(select(time_col).where(in_month).limit(1)).first():
+            table = ensure_partition(db, month)
+            moved += db.execute(
+                table.insert().from_select(list(table.c), select(base).where(in_month))
+            ).rowcount
+            db.execute(base.delete().where(in_month))
+        month = next_month(month)
+    return moved
+
+
+def drop_partition(db, month):
+    """Удаляет раздел месяца целиком (retention без построчного DELETE)."""
+    partition_table(month).drop(db.connection(), checkfirst=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    from db_session import SessionLocal
+    from rollups import mark_rollups_dirty
+
+    parser = argparse.ArgumentParser(description="Помесячные разделы measurements")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="разделы и число строк")
+    sub.add_parser("split", help="перенести measurements в разделы")
+    drop = sub.add_parser("drop-before", help="удалить разделы до месяца ГГГГ-ММ")
+    drop.add_argument("month")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        if args.command == "list":
+            for month in existing_months(db):
+                rows = db.execute(
+                    select(func.count()).select_from(partition_table(month))
+                ).scalar()
+                print(f"{partition_name(month)}: {rows}")
+        elif args.command == "split":
+            moved = split_measurements(db)
+            db.commit()
+            print(f"Перенесено в разделы строк: {moved}")
+        else:
+            limit = month_of(datetime.strptime(args.month, "%Y-%m"))
+            dropped = [m for m in existing_months(db) if m < limit]
+            for month in dropped:
+                drop_partition(db, month)
+            if dropped:
+                mark_rollups_dirty(
+                    db, None, month_start(dropped[0]), month_start(limit)
+                )
+            db.commit()
+            print("Удалены разделы:", ", ".join(map(partition_name, dropped)) or "нет")
@@ -1,17 +1,19 @@
 # from datetime import datetime, date
 from sqlalchemy import extract
 from db_session import SessionLocal
-from init_db import Measurement  # предполагаем, что так называется файл с моделями
+from partitions import delete_range  # целые месяцы быстрее: partitions.py drop-before
+from archive import require_not_archived
+from rollups import mark_rollups_dirty
 from datetime import datetime, timedelta
 
 start = datetime(2025, 7, 13)
 end = start + timedelta(days=1)
 
+require_not_archived(None, start, end - timedelta(microseconds=1))
+
 with SessionLocal() as db:
-    deleted_rows = db.query(Measurement).filter(
-        Measurement.measurement_time >= start,
-        Measurement.measurement_time < end
-    ).delete(synchronize_session=False)
+    deleted_rows = delete_range(db, None, start, end)
 
+    mark_rollups_dirty(db, None, start, end)
     db.commit()
     print(f"Удалено записей: {deleted_rows}")
\ No newline at end of file
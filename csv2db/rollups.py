@@ -0,0 +1,291 @@
+import logging
+import re
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, event, inspect, select, text
+from db_session import SessionLocal
+from partitions import measurement_source_sql
+from archive import hot_ranges
+from init_db import (
+    EPOCH,
+    MEASUREMENT_EPOCH_SQL,
+    MEASUREMENT_TIME_COLUMN,
+    Measurement,
+    MeasurementRollup,
+    RollupState,
+)
+
+logger = logging.getLogger(__name__)
+
+# Разрешения агрегатов в минутах, от мелкого к крупному.
+# Каждый уровень строится из предыдущего (1 мин — из сырых измерений).
+ROLLUP_RESOLUTIONS = (1, 15, 60, 1440)
+DAY_SECONDS = 86400
+
+# Пока агрегаты не построены (python rollups.py --if-missing), запросы идут по
+# сырым измерениям; готовность перепроверяется не чаще раза в минуту
+ROLLUPS_RECHECK_SECONDS = 60
+_rollups_ready = False
+_rollups_checked_at = None
+
+_RAW_SOURCE = """
+    SELECT sensor_id, value, {time_column} AS ord,
+           ({epoch} / :step) * :step AS bucket,
+           value AS v_sum, 1 AS v_count, value AS v_min, value AS v_max,
+           value AS v_last
+    FROM {{source}}
+    WHERE value IS NOT NULL{{filters}}
+""".format(time_column=MEASUREMENT_TIME_COLUMN, epoch=MEASUREMENT_EPOCH_SQL)
+
+_ROLLUP_SOURCE = """
+    SELECT sensor_id, value_sum AS value, bucket_start AS ord,
+           (bucket_start / :step) * :step AS bucket,
+           value_sum AS v_sum, value_count AS v_count, value_min AS v_min,
+           value_max AS v_max, value_last AS v_last
+    FROM measurement_rollups
+    WHERE resolution = :source_resolution{filters}
+"""
+
+_INSERT_ROLLUP = """
+    INSERT INTO measurement_rollups (
+        sensor_id, resolution, bucket_start,
+        value_sum, value_count, value_min, value_max, value_last
+    )
+    SELECT sensor_id, :resolution, bucket,
+           SUM(v_sum), SUM(v_count), MIN(v_min), MAX(v_max),
+           MAX(CASE WHEN rn = 1 THEN v_last END)
+    FROM (
+        SELECT src.*,
+               ROW_NUMBER() OVER (
+                   PARTITION BY sensor_id, bucket ORDER BY ord DESC
+               ) AS rn
+        FROM ({source}) AS src
+    )
+    GROUP BY sensor_id, bucket
+"""
+
+
+def to_epoch(dt):
+    return int((dt - EPOCH).total_seconds())
+
+
+def _day_bounds(start_dt, end_dt):
+    """Расширяет диапазон [start_dt, end_dt] до границ суток (секунды от эпохи)."""
+    start_ts = None
+    end_ts = None
+    if start_dt is not None:
+        start_ts = to_epoch(start_dt) // DAY_SECONDS * DAY_SECONDS
+    if end_dt is not None:
+        end_ts = to_epoch(end_dt) // DAY_SECONDS * DAY_SECONDS + DAY_SECONDS
+    return start_ts, end_ts
+
+
+def rollups_built(db):
+    """Построены ли агрегаты целиком (есть отметка в measurement_rollups_state)."""
+    if not inspect(db.connection()).has_table(RollupState.__tablename__):
+        return False
+    return db.execute(select(RollupState.state_id).limit(1)).first() is not None
+
+
+def _execute(db, sql, params):
+    """Выполняет text-SQL, передавая только используемые в нём параметры."""
+    used = {k: v for k, v in params.items() if re.search(rf":{k}\b", sql)}
+    stmt = text(sql)
+    if "sensor_ids" in used:
+        stmt = stmt.bindparams(bindparam("sensor_ids", expanding=True))
+    for key in ("start_dt", "end_dt"):
+        if key in used:
+            stmt = stmt.bindparams(
+                bindparam(key, type_=Measurement.measurement_time.type)
+            )
+    return db.execute(stmt, used)
+
+
+def _refresh_range(db, sensor_ids, start_ts, end_ts):
+    raw_filters = []
+    rollup_filters = []
+    params = {}
+    if sensor_ids is not None:
+        raw_filters.append("sensor_id IN :sensor_ids")
+        rollup_filters.append("sensor_id IN :sensor_ids")
+        params["sensor_ids"] = list(sensor_ids)
+    if start_ts is not None:
+        raw_filters.append(f"{MEASUREMENT_TIME_COLUMN} >= :start_dt")
+        rollup_filters.append("bucket_start >= :start_ts")
+        params["start_dt"] = EPOCH + timedelta(seconds=start_ts)
+        params["start_ts"] = start_ts
+    if end_ts is not None:
+        raw_filters.append(f"{MEASUREMENT_TIME_COLUMN} < :end_dt")
+        rollup_filters.append("bucket_start < :end_ts")
+        params["end_dt"] = EPOCH + timedelta(seconds=end_ts)
+        params["end_ts"] = end_ts
+    raw_where = "".join(f" AND {f}" for f in raw_filters)
+    raw_table = measurement_source_sql(db, params.get("start_dt"), params.get("end_dt"))
+    rollup_where = "".join(f" AND {f}" for f in rollup_filters)
+
+    source_resolution = None
+    for resolution in ROLLUP_RESOLUTIONS:
+        level_params = {
+            **params,
+            "resolution": resolution,
+            "step": resolution * 60,
+            "source_resolution": source_resolution,
+        }
+        _execute(
+            db,
+            "DELETE FROM measurement_rollups WHERE resolution = :resolution"
+            + rollup_where,
+            level_params,
+        )
+        if source_resolution is None:
+            source = _RAW_SOURCE.format(source=raw_table, filters=raw_where)
+        else:
+            source = _ROLLUP_SOURCE.format(filters=rollup_where)
+        _execute(db, _INSERT_ROLLUP.format(source=source), level_params)
+        source_resolution = resolution
+
+
+def refresh_rollups(db, sensor_ids=None, start_dt=None, end_dt=None):
+    """Пересчитывает агрегаты сенсоров за период (None — все сенсоры / всё время).
+
+    Границы расширяются до целых суток, чтобы все уровни оставались согласованными.
+    """
+    if sensor_ids is not None:
+        sensor_ids = sorted(set(sensor_ids))
+        if not sensor_ids:
+            return
+    start_ts, end_ts = _day_bounds(start_dt, end_dt)
+    # агрегаты архивных месяцев не пересчитываются: их строк в SQLite нет
+    for lo, hi in hot_ranges(start_ts, end_ts):
+        _refresh_range(db, sensor_ids, lo, hi)
+
+
+def mark_rollups_dirty(db, sensor_ids=None, start_dt=None, end_dt=None):
+    """Отмечает диапазон для пересчёта агрегатов при commit сессии.
+
+    sensor_ids=None — все сенсоры; start_dt/end_dt=None — без ограничения.
+    """
+    dirty = db.info.setdefault("dirty_rollups", {})
+    keys = [None] if sensor_ids is None else sensor_ids
+    for key in keys:
+        if key in dirty:
+            old_start, old_end = dirty[key]
+            if old_start is not None and start_dt is not None:
+                old_start = min(old_start, start_dt)
+            else:
+                old_start = None
+            if old_end is not None and end_dt is not None:
+                old_end = max(old_end, end_dt)
+            else:
+                old_end = None
+            dirty[key] = (old_start, old_end)
+        else:
+            dirty[key] = (start_dt, end_dt)
+
+
+def flush_dirty_rollups(db):
+    dirty = db.info.pop("dirty_rollups", None)
+    # до первого построения агрегаты не ведутся: ensure_rollups посчитает всё
+    if not dirty or not rollups_built(db):
+        return
+    if None in dirty:
+        start_dt, end_dt = dirty.pop(None)
+        refresh_rollups(db, None, start_dt, end_dt)
+    by_range = {}
+    for sensor_id, bounds in dirty.items():
+        by_range.setdefault(bounds, []).append(sensor_id)
+    for (start_dt, end_dt), sensor_ids in by_range.items():
+        refresh_rollups(db, sensor_ids, start_dt, end_dt)
+
+
+def _mark_built(db):
+    RollupState.__table__.create(db.connection(), checkfirst=True)
+    db.execute(RollupState.__table__.delete())
+    db.execute(RollupState.__table__.insert().values(built_at=datetime.now()))
+
+
+def ensure_rollups(db):
+    """Строит агрегаты, если они ещё не построены, и коммитит.
+
+    Явный шаг развёртывания (python rollups.py --if-missing в restart.sh):
+    на большой БД первое построение занимает минуты. Агрегаты, построенные
+    до появления отметки, только отмечаются.
+    """
+    MeasurementRollup.__table__.create(db.connection(), checkfirst=True)
+    if not rollups_built(db):
+        has_rollups = db.execute(
+            text("SELECT 1 FROM measurement_rollups LIMIT 1")
+        ).first()
+        if not has_rollups:
+            logger.info("Построение агрегатов measurement_rollups...")
+            refresh_rollups(db)
+        _mark_built(db)
+    db.commit()
+    check_rollups(db)
+
+
+def check_rollups(db):
+    """Проверяет, построены ли агрегаты; ничего не пишет в БД."""
+    global _rollups_ready, _rollups_checked_at
+    _rollups_ready = rollups_built(db)
+    _rollups_checked_at = time.monotonic()
+    if not _rollups_ready:
+        logger.warning(
+            "Агрегаты measurement_rollups не построены (python rollups.py "
+            "--if-missing), запросы идут по сырым измерениям"
+        )
+    return _rollups_ready
+
+
+def _rollups_available():
+    if not _rollups_ready and (
+        _rollups_checked_at is None
+        or time.monotonic() - _rollups_checked_at >= ROLLUPS_RECHECK_SECONDS
+    ):
+        with SessionLocal() as db:
+            check_rollups(db)
+    return _rollups_ready
+
+
+def pick_rollup_resolution(interval_minutes, start_dt=None, end_dt=None):
+    """Крупнейшее разрешение агрегатов, кратное интервалу и границам диапазона."""
+    if not _rollups_available():
+        return None
+    for resolution in reversed(ROLLUP_RESOLUTIONS):
+        step = resolution * 60
+        if interval_minutes % resolution:
+            continue
+        if start_dt is not None and (start_dt - EPOCH).total_seconds() % step:
+            continue
+        if end_dt is not None and (end_dt - EPOCH).total_seconds() % step:
+            continue
+        return resolution
+    return None
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _refresh_dirty_rollups(db):
+    flush_dirty_rollups(db)
+
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _drop_dirty_rollups(db, transaction):
+    if transaction.parent is None:
+        db.info.pop("dirty_rollups", None)
+
+
+if __name__ == "__main__":
+    # python rollups.py               # пересчитать все агрегаты
+    # python rollups.py --if-missing  # только если ещё не построены (restart.sh)
+    import sys
+
+    with SessionLocal() as db:
+        if "--if-missing" in sys.argv[1:]:
+            ensure_rollups(db)
+            print("Агрегаты measurement_rollups построены.")
+        else:
+            MeasurementRollup.__table__.create(db.connection(), checkfirst=True)
+            refresh_rollups(db)
+            _mark_built(db)
+            db.commit()
+            print("Агрегаты measurement_rollups пересчитаны.")
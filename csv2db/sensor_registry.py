@@ -0,0 +1,153 @@
+import threading
+from collections import namedtuple
+from sqlalchemy import event, func, select
+from db_session import SessionLocal
+from init_db import Sensor
+
+SensorInfo = namedtuple(
+    "SensorInfo", ["sensor_id", "sensor_name", "sensor_type", "unit", "visible"]
+)
+
+_SENSOR_COLUMNS = (
+    Sensor.sensor_id,
+    Sensor.sensor_name,
+    Sensor.sensor_type,
+    Sensor.unit,
+    Sensor.visible,
+)
+
+# Дешёвая проверка, не появились ли сенсоры из других процессов
+# (прогнозы main.py, hindcast): max(sensor_id) и число строк
+_SIGNATURE = select(func.max(Sensor.sensor_id), func.count()).select_from(Sensor)
+
+
+class SensorRegistry:
+    """Кэш справочника сенсоров на процесс.
+
+    Загружается целиком при первом обращении; all() перечитывает справочник,
+    если в таблице sensors изменились max(sensor_id) или число строк.
+    Сенсоры, созданные внутри незакоммиченной сессии, хранятся в db.info и
+    попадают в общий кэш только после commit (при rollback отбрасываются).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_id = None
+        self._by_name = None
+        self._signature = None
+
+    def _ensure_loaded(self, db):
+        with self._lock:
+            if self._by_id is not None:
+                return
+            with db.get_bind().connect() as conn:
+                rows = conn.execute(
+                    select(*_SENSOR_COLUMNS).order_by(Sensor.sensor_id)
+                ).all()
+                self._signature = tuple(conn.execute(_SIGNATURE).one())
+            self._by_id = {}
+            self._by_name = {}
+            for row in rows:
+                self._put(SensorInfo(*row))
+
+    def _put(self, info):
+        self._by_id[info.sensor_id] = info
+        self._by_name.setdefault(info.sensor_name, info)
+
+    @staticmethod
+    def _pending(db):
+        return db.info.setdefault("pending_sensors", {})
+
+    def get(self, db, sensor_id):
+        self._ensure_loaded(db)
+        with self._lock:
+            info = self._by_id.get(sensor_id)
+        if info is not None:
+            return info
+        for pending in self._pending(db).values():
+            if pending.sensor_id == sensor_id:
+                return pending
+        row = db.execute(
+            select(*_SENSOR_COLUMNS).where(Sensor.sensor_id == sensor_id)
+        ).first()
+        if row is None:
+            return None
+        info = SensorInfo(*row)
+        with self._lock:
+            self._put(info)
+        return info
+
+    def get_by_name(self, db, sensor_name):
+        self._ensure_loaded(db)
+        with self._lock:
+            info = self._by_name.get(sensor_name)
+        if info is not None:
+            return info
+        pending = self._pending(db).get(sensor_name)
+        if pending is not None:
+            return pending
+        row = db.execute(
+            select(*_SENSOR_COLUMNS).where(Sensor.sensor_name == sensor_name)
+        ).first()
+        if row is None:
+            return None
+        info = SensorInfo(*row)
+        with self._lock:
+            self._put(info)
+        return info
+
+    def _reload_if_stale(self, db):
+        with db.get_bind().connect() as conn:
+            signature = tuple(conn.execute(_SIGNATURE).one())
+        with self._lock:
+            if self._by_id is not None and signature != self._signature:
+                self.invalidate()
+        self._ensure_loaded(db)
+
+    def all(self, db):
+        self._reload_if_stale(db)
+        with self._lock:
+            sensors = list(self._by_id.values())
+        sensors.extend(self._pending(db).values())
+        return sorted(sensors, key=lambda s: s.sensor_id)
+
+    def add(self, db, sensor):
+        """Регистрирует только что созданный (flush) сенсор в рамках сессии."""
+        info = SensorInfo(
+            sensor.sensor_id,
+            sensor.sensor_name,
+            sensor.sensor_type,
+            sensor.unit,
+            True if sensor.visible is None else sensor.visible,
+        )
+        self._pending(db)[info.sensor_name] = info
+        return info
+
+    def invalidate(self):
+        with self._lock:
+            self._by_id = None
+            self._by_name = None
+
+    def _promote(self, db):
+        pending = db.info.pop("pending_sensors", None)
+        if not pending:
+            return
+        with self._lock:
+            if self._by_id is None:
+                return
+            for info in pending.values():
+                self._put(info)
+
+
+sensor_registry = SensorRegistry()
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _promote_pending_sensors(db):
+    sensor_registry._promote(db)
+
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _drop_pending_sensors(db, transaction):
+    if transaction.parent is None:
+        db.info.pop("pending_sensors", None)
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_session  # noqa: E402
+from init_db import Base  # noqa: E402
+from sensor_registry import sensor_registry  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Пустая БД во временном каталоге, к ней привязан db_session.SessionLocal."""
+    engine = db_session.make_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(engine)
+    db_session.SessionLocal.configure(bind=engine)
+    sensor_registry.invalidate()
+    yield engine
+    sensor_registry.invalidate()
+    db_session.SessionLocal.configure(bind=db_session.engine)
+    engine.dispose()
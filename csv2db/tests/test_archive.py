@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select
+
+pytest.importorskip("pyarrow")
+
+import archive  # noqa: E402
+from comparison_utils import bulk_upsert_measurements  # noqa: E402
+from db_session import SessionLocal  # noqa: E402
+from init_db import MeasurementRollup, Sensor  # noqa: E402
+from rollups import ensure_rollups, refresh_rollups  # noqa: E402
+
+MAY = (2025, 5)
+START = datetime(2025, 5, 31, 22)
+
+
+def _records(value):
+    return [
+        {
+            "sensor_id": 1,
+            "measurement_time": START + timedelta(minutes=i),
+            "value": value + i,
+        }
+        for i in range(180)
+    ]
+
+
+def _rollups(db):
+    return db.execute(
+        select(MeasurementRollup).order_by(
+            MeasurementRollup.resolution, MeasurementRollup.bucket_start
+        )
+    ).all()
+
+
+@pytest.fixture
+def archived_may(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    with SessionLocal() as db:
+        db.execute(
+            insert(Sensor),
+            [{"sensor_name": "s1", "sensor_type": "radiation", "unit": "W/m2"}],
+        )
+        bulk_upsert_measurements(db, _records(0.0))
+        db.commit()
+        ensure_rollups(db)
+        assert archive.export_month(db, MAY) == 120
+        db.commit()
+    return engine
+
+
+def test_upsert_into_archived_month_is_refused(archived_may):
+    with SessionLocal() as db:
+        before = [tuple(r) for r in _rollups(db)]
+        with pytest.raises(archive.ArchivedDataError, match="2025-05"):
+            bulk_upsert_measurements(db, _records(100.0))
+        db.rollback()
+        assert [tuple(r) for r in _rollups(db)] == before
+        assert archive.count_archived([1]) == 120
+
+
+def test_upsert_after_restore(archived_may):
+    with SessionLocal() as db:
+        assert archive.restore_month(db, MAY) == 120
+        assert archive.archived_months() == []
+        bulk_upsert_measurements(db, _records(100.0))
+        db.commit()
+        day = db.execute(
+            select(MeasurementRollup.value_max).where(
+                MeasurementRollup.resolution == 1440,
+                MeasurementRollup.bucket_start
+                == int((datetime(2025, 5, 31) - datetime(1970, 1, 1)).total_seconds()),
+            )
+        ).scalar_one()
+    assert day == 219.0
+
+
+def test_refresh_keeps_archived_rollups_without_pyarrow(archived_may, monkeypatch):
+    monkeypatch.setattr(archive, "pa", None)
+    with SessionLocal() as db:
+        before = [tuple(r) for r in _rollups(db)]
+        refresh_rollups(db)
+        db.commit()
+        assert [tuple(r) for r in _rollups(db)] == before
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, insert, text
+
+from db_session import SessionLocal
+from init_db import Sensor
+from migrate_storage import current_layout, migrate
+from partitions import ensure_partition, existing_months
+
+START = datetime(2025, 5, 31, 22)
+
+
+def _fill_partitions(engine):
+    with SessionLocal() as db:
+        db.execute(
+            insert(Sensor),
+            [{"sensor_name": "s1", "sensor_type": "radiation", "unit": "W/m2"}],
+        )
+        by_month = {}
+        for i in range(240):
+            t = START + timedelta(minutes=i)
+            by_month.setdefault((t.year, t.month), []).append(
+                {"sensor_id": 1, "measurement_time": t, "value": float(i)}
+            )
+        for month, rows in by_month.items():
+            db.execute(ensure_partition(db, month).insert(), rows)
+        db.commit()
+
+
+def _rows(conn, table):
+    if current_layout(conn, table) == "compact":
+        epoch = "ts"
+    else:
+        epoch = "CAST(strftime('%s', measurement_time) AS INTEGER)"
+    return conn.execute(
+        text(f"SELECT sensor_id, {epoch}, value FROM {table} ORDER BY 1, 2")
+    ).all()
+
+
+def test_migrate_converts_partitions(engine):
+    _fill_partitions(engine)
+    with engine.connect() as conn:
+        months = existing_months(conn)
+        tables = [f"measurements_{y:04d}_{m:02d}" for y, m in months]
+        before = {table: _rows(conn, table) for table in tables}
+    assert months == [(2025, 5), (2025, 6)]
+
+    assert migrate(engine, "compact", vacuum=False) == 240
+    with engine.connect() as conn:
+        for table in ["measurements"] + tables:
+            assert current_layout(conn, table) == "compact"
+        for table in tables:
+            assert _rows(conn, table) == before[table]
+        assert existing_months(conn) == months
+
+    assert migrate(engine, "compact", vacuum=False) is None
+
+    assert migrate(engine, "classic", vacuum=False) == 240
+    with engine.connect() as conn:
+        for table in tables:
+            assert current_layout(conn, table) == "classic"
+            assert _rows(conn, table) == before[table]
+        indexes = {i["name"] for i in inspect(conn).get_indexes("measurements_2025_06")}
+    assert indexes == {
+        "idx_measurements_time_2025_06",
+        "idx_measurements_sensor_time_2025_06",
+    }
@@ -44,18 +44,14 @@ solar_data = read_solar_radiation_data(file_path)
 
 solar_data['power_generation'] = solar_data['rad'].apply(solar_radiation_to_power)
 
-voltage_results = []
-
-for index, row in solar_data.iterrows():
-    
-    P_g_interval = row['power_generation']
-
-    net, R_ohm, X_L_ohm, C_nF = pn.create_and_run_network(U, num_nodes, load_variation(), Q, P_g_interval, cosf_g, rho, L_m, S_mm2, D, f, epsilon, mu_0)
-
-    voltage_values = get_voltage_values(net)
-    voltage_results.append(voltage_values)
-
-    print(f"Время {row['datetime']}: Генерация мощности = {P_g_interval:.2f} Вт, Напряжения в узлах = {voltage_values}")
+# Сеть строится один раз, на каждом шаге меняются только мощности нагрузок и генерации
+net, R_ohm, X_L_ohm, C_nF = pn.create_network(U, num_nodes, rho, L_m, S_mm2, D, f, epsilon, mu_0, cosf_g)
+load_values = [load_variation() for _ in range(len(solar_data))]
+vm_pu, _ = pn.run_time_series(net, load_values, Q, solar_data['power_generation'].values)
+voltage_results = vm_pu * U
+
+for dt, P_g_interval, voltage_values in zip(solar_data['datetime'], solar_data['power_generation'], voltage_results):
+    print(f"Время {dt}: Генерация мощности = {P_g_interval:.2f} Вт, Напряжения в узлах = {voltage_values}")
 
 
 plt.figure(figsize=(10, 6))
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+I_SC = 1361  # Солнечная постоянная, Вт/м²
+PHI_DEFAULT = 42.7185  # Географическая широта СЭС
+TAU_CLEAR = 0.78  # Прозрачность атмосферы для ясного неба
+K_DIFF = 1.25  # Вклад рассеянного излучения (~25% от прямого)
+
+
+def day_of_year(dates):
+    """Номера дней в году (1-366) для массива дат."""
+    return pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(dates))).dayofyear.to_numpy()
+
+
+def calc_radiation_improved(n, phi=PHI_DEFAULT):
+    """Максимальная радиация ясного неба в полдень, Вт/м².
+
+    n — номер дня в году, phi — широта; принимает скаляры или массивы
+    (с broadcasting, например дни (D, 1) и широты (1, L)).
+    """
+    n = np.asarray(n, dtype=np.float64)
+    phi = np.asarray(phi, dtype=np.float64)
+    delta = 23.45 * np.sin(np.radians((360 / 365) * (n - 81)))
+    alpha = np.maximum(90 - np.abs(phi - delta), 0)  # α ≥ 0
+    E0 = 1 + 0.033 * np.cos(np.radians((360 / 365) * n))
+    I_ext = I_SC * E0 * np.sin(np.radians(alpha))
+    return I_ext * TAU_CLEAR * K_DIFF
+
+
+def _peak_masks(values, axis):
+    """Разности по времени и маски шагов до/после максимума ряда.
+
+    Возвращает (diff, prev, step, peak): diff[j] = v[j+1] - v[j], prev[j] = v[j],
+    step — индекс j в форме, совместимой с diff, peak — индекс максимума
+    (первого) с сохранённой осью.
+    """
+    values = np.moveaxis(np.asarray(values, dtype=np.float64), axis, -1)
+    peak = np.argmax(values, axis=-1)[..., np.newaxis]
+    diff = np.diff(values, axis=-1)
+    prev = values[..., :-1]
+    step = np.arange(diff.shape[-1])
+    return diff, prev, step, peak
+
+
+def sunny_day_mask(values, threshold, tolerance=0.03, threshold_tolerance=0.05, axis=0):
+    """Маска солнечных дней для рядов радиации values (время по оси axis).
+
+    День солнечный, если в нём нет пропусков, максимум не ниже
+    threshold * (1 - threshold_tolerance), максимум не на краю ряда и ряд
+    растёт до максимума и убывает после него с допуском tolerance
+    (относительно предыдущего значения). threshold — скаляр или массив по дням.
+    """
+    values = np.moveaxis(np.asarray(values, dtype=np.float64), axis, -1)
+    has_nan = np.isnan(values).any(axis=-1)
+    filled = np.where(np.isnan(values), -np.inf, values)
+    diff, prev, step, peak = _peak_masks(filled, -1)
+    length = values.shape[-1]
+
+    max_value = filled.max(axis=-1)
+    peak_ok = (peak[..., 0] >= 1) & (peak[..., 0] <= length - 2)
+    # как и в поэлементной проверке, шаги в сам максимум и из него не проверяются
+    before = step < peak - 1
+    after = step > peak
+    with np.errstate(invalid="ignore"):
+        rising = np.where(before, diff >= -tolerance * prev, True).all(axis=-1)
+        falling = np.where(after, diff <= tolerance * prev, True).all(axis=-1)
+    return (
+        ~has_nan
+        & (max_value >= np.asarray(threshold) * (1 - threshold_tolerance))
+        & peak_ok
+        & rising
+        & falling
+    )
+
+
+def clear_cell_mask(data, rad_max_treshold=600, rad_delta=20):
+    """Маска «ясных» ячеек сетки: data (..., время, ячейки) -> (..., ячейки).
+
+    Ячейка ясная, если её максимум не ниже rad_max_treshold, а до максимума
+    радиация не падает больше чем на rad_delta за шаг (после — не растёт).
+    """
+    diff, _, step, peak = _peak_masks(data, -2)
+    rad_max = np.max(data, axis=-2)
+    no_drop = np.where(step < peak, diff >= -rad_delta, True).all(axis=-1)
+    no_rise = np.where(step >= peak, diff <= rad_delta, True).all(axis=-1)
+    return no_drop & no_rise & (rad_max >= rad_max_treshold)
+
+
+def clear_day_mask(data, rad_max_treshold=600, rad_delta=20):
+    """Ясный день — все ячейки сетки ясные: data (..., время, ячейки) -> (...)."""
+    return clear_cell_mask(data, rad_max_treshold, rad_delta).all(axis=-1)
@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+from collections import namedtuple
+import numpy as np
+
+# Обучающая выборка: время (datetime64[s]), признаки GFS (N, F) float32,
+# целевые ряды {имя: float64 (N,)}
+Dataset = namedtuple("Dataset", ["time", "X", "targets"])
+
+META_FILE = "meta.json"
+TIME_FILE = "time.i8"
+X_FILE = "X.f32"
+
+
+def _target_file(name):
+    return f"y_{name}.f64"
+
+
+class DatasetStore():
+    """Колоночное хранилище обучающей выборки в каталоге path.
+
+    Каждая колонка — отдельный «сырой» бинарный файл, в который строки
+    дописываются в конец (append по дням без перезаписи всего набора).
+    Число строк фиксируется в meta.json после записи данных, поэтому
+    оборванная запись просто отбрасывается при чтении. load() отображает
+    файлы в память (np.memmap) без чтения целиком.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def meta(self):
+        meta_path = self._file(META_FILE)
+        if not os.path.isfile(meta_path):
+            return None
+        with open(meta_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, meta):
+        tmp_path = self._file(META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._file(META_FILE))
+
+    def __len__(self):
+        meta = self.meta()
+        return 0 if meta is None else meta["rows"]
+
+    def _truncate(self, meta):
+        """Обрезает файлы до зафиксированного числа строк (после сбоя записи)."""
+        rows = meta["rows"]
+        sizes = {TIME_FILE: 8, X_FILE: 4 * meta["n_features"]}
+        sizes.update({_target_file(name): 8 for name in meta["targets"]})
+        for name, row_size in sizes.items():
+            path = self._file(name)
+            if os.path.getsize(path) != rows * row_size:
+                with open(path, "r+b") as f:
+                    f.truncate(rows * row_size)
+
+    def append(self, time, X, targets, skip_existing=True):
+        """Дописывает строки. targets — словарь {имя: массив (N,)}.
+
+        При skip_existing=True строки с уже сохранённым временем пропускаются
+        (как combine_first: остаётся ранее записанное значение).
+        Возвращает число добавленных строк.
+        """
+        time = np.asarray(time, dtype="datetime64[s]")
+        X = np.asarray(X, dtype=np.float32)
+        targets = {name: np.asarray(values, dtype=np.float64) for name, values in targets.items()}
+        if X.ndim != 2 or len(X) != len(time) or any(len(v) != len(time) for v in targets.values()):
+            raise ValueError("Размеры time, X и targets не совпадают")
+
+        meta = self.meta()
+        if meta is None:
+            os.makedirs(self.path, exist_ok=True)
+            meta = {"rows": 0, "n_features": X.shape[1], "targets": sorted(targets)}
+            for name in [TIME_FILE, X_FILE] + [_target_file(n) for n in meta["targets"]]:
+                open(self._file(name), "wb").close()
+        if X.shape[1] != meta["n_features"] or sorted(targets) != meta["targets"]:
+            raise ValueError(
+                f"Несовместимые данные: {X.shape[1]} признаков и цели {sorted(targets)}, "
+                f"в хранилище {meta['n_features']} и {meta['targets']}"
+            )
+        self._truncate(meta)
+
+        order = np.argsort(time, kind="stable")
+        keep = order
+        if skip_existing and meta["rows"]:
+            existing = self.load().time
+            keep = order[~np.isin(time[order], existing)]
+        _, first = np.unique(time[keep], return_index=True)
+        keep = keep[np.sort(first)]
+        if len(keep) == 0:
+            return 0
+
+        with open(self._file(TIME_FILE), "ab") as f:
+            f.write(time[keep].astype(np.int64).tobytes())
+        with open(self._file(X_FILE), "ab") as f:
+            f.write(np.ascontiguousarray(X[keep]).tobytes())
+        for name in meta["targets"]:
+            with open(self._file(_target_file(name)), "ab") as f:
+                f.write(targets[name][keep].tobytes())
+        meta["rows"] += len(keep)
+        self._write_meta(meta)
+        return len(keep)
+
+    def load(self, mmap=True):
+        """Dataset с колонками-отображениями в память (mmap=False — в ОЗУ)."""
+        meta = self.meta()
+        if meta is None or meta["rows"] == 0:
+            n_features = 0 if meta is None else meta["n_features"]
+            names = [] if meta is None else meta["targets"]
+            return Dataset(
+                np.empty(0, dtype="datetime64[s]"),
+                np.empty((0, n_features), dtype=np.float32),
+                {name: np.empty(0) for name in names},
+            )
+        rows = meta["rows"]
+
+        def column(name, dtype, shape):
+            if mmap:
+                return np.memmap(self._file(name), dtype=dtype, mode="r", shape=shape)
+            return np.fromfile(self._file(name), dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+        time = column(TIME_FILE, np.int64, (rows,)).view("datetime64[s]")
+        X = column(X_FILE, np.float32, (rows, meta["n_features"]))
+        targets = {name: column(_target_file(name), np.float64, (rows,)) for name in meta["targets"]}
+        return Dataset(time, X, targets)
+
+    def days(self):
+        """Даты (datetime64[D]), уже присутствующие в хранилище."""
+        return np.unique(self.load().time.astype("datetime64[D]"))
+
+
+def select(ds, mask):
+    """Подвыборка Dataset по булевой маске или индексам."""
+    return Dataset(ds.time[mask], ds.X[mask], {name: values[mask] for name, values in ds.targets.items()})
+
+
+def select_days(ds, days):
+    """Строки, попадающие в перечисленные даты (datetime64[D])."""
+    return select(ds, np.isin(ds.time.astype("datetime64[D]"), np.asarray(days, dtype="datetime64[D]")))
+
+
+def from_pickle(pkl_path, store_path):
+    """Переносит старый *_dataset.pkl (DataFrame с колонкой X) в DatasetStore."""
+    import pandas as pd
+
+    df = pd.read_pickle(pkl_path)
+    target_cols = [col for col in df.columns if col != "X"]
+    store = DatasetStore(store_path)
+    return store.append(
+        df.index.values,
+        np.stack(df["X"].values),
+        {col: df[col].to_numpy(dtype=np.float64) for col in target_cols},
+    )
+
+
+if __name__ == "__main__":
+    # python dataset_store.py energy_dataset.pkl energy_dataset
+    print("Перенесено строк:", from_pickle(sys.argv[1], sys.argv[2]))
@@ -0,0 +1,23 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def window_features(rad, delta_t=2, pad=True):
+    """Признаки скользящего окна по времени: (T, F) -> (N, (2*delta_t+1)*F).
+
+    Строка i — склеенные шаги i-delta_t..i+delta_t (как np.hstack окна).
+    pad=True дополняет края нулями (N = T, как при прогнозе), pad=False
+    оставляет только полные окна (N = T - 2*delta_t, как при обучении).
+    Результат — представление исходного массива без копирования данных
+    (кроме нулевого дополнения).
+    """
+    rad = np.asarray(rad)
+    if rad.ndim == 1:
+        rad = rad[:, np.newaxis]
+    if pad:
+        rad = np.pad(rad, ((delta_t, delta_t), (0, 0)))
+    width = 2 * delta_t + 1
+    if len(rad) < width:
+        return np.empty((0, width * rad.shape[1]), dtype=rad.dtype)
+    windows = sliding_window_view(rad, width, axis=0)   # (N, F, width)
+    return windows.transpose(0, 2, 1).reshape(len(windows), -1)
@@ -0,0 +1,125 @@
+import os
+import time
+import random
+import logging
+import tempfile
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+NOMADS_URL = "https://nomads.ncep.noaa.gov/cgi-bin/filter_gfs_0p25.pl"
+# Параметры фильтра NOMADS: DSWRF на поверхности над районом СЭС
+FILTER_QUERY = "file={0}&lev_surface=on&var_DSWRF=on&subregion=&leftlon=69&rightlon=72.6\
+&toplat=44&bottomlat=41.4&dir={1}"
+START_HOUR = 18
+END_HOUR = 33
+
+
+def grib_filename(hour, step):
+    return f"gfs.t{hour:02}z.pgrb2.0p25.f{step:03}"
+
+
+def is_valid_grib(filepath):
+    """Файл непустой, начинается с 'GRIB' и заканчивается маркером '7777'."""
+    try:
+        if os.path.getsize(filepath) < 8:
+            return False
+        with open(filepath, 'rb') as f:
+            head = f.read(4)
+            f.seek(-4, os.SEEK_END)
+            tail = f.read(4)
+        return head == b'GRIB' and tail == b'7777'
+    except OSError:
+        return False
+
+
+def make_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def backoff_delay(attempt, base=2.0, cap=120.0):
+    """Экспоненциальная задержка с полным джиттером."""
+    return random.uniform(0, min(cap, base * 2 ** min(attempt, 16)))
+
+
+# Общее время ожидания файла: NOMADS может выложить цикл с опозданием
+# (прежний цикл 30 попыток × 30 с давал ~15 мин)
+RETRY_DEADLINE = 15 * 60
+
+
+def download_file(session, url, filepath, deadline=RETRY_DEADLINE, timeout=60,
+                  base_delay=2.0, max_delay=120.0):
+    """Скачивает файл во временный *.part и атомарно переименовывает после проверки.
+
+    Повторяет попытки с экспоненциальной задержкой, пока не истекут deadline
+    секунд с начала скачивания.
+    """
+    grib_dir = os.path.dirname(filepath)
+    give_up_at = time.monotonic() + deadline
+    last_error = None
+    attempt = 0
+    while True:
+        fd, tmp_path = tempfile.mkstemp(dir=grib_dir, prefix=os.path.basename(filepath), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with session.get(url, stream=True, timeout=timeout) as r:
+                    r.raise_for_status()
+                    for chunk in r.iter_content(chunk_size=1 << 16):
+                        f.write(chunk)
+            if not is_valid_grib(tmp_path):
+                raise ValueError("неполный или повреждённый GRIB")
+            os.replace(tmp_path, filepath)
+            return filepath
+        except (requests.RequestException, OSError, ValueError) as e:
+            last_error = e
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                logging.warning(f"{os.path.basename(filepath)}: попытка {attempt + 1} не удалась ({e})")
+                break
+            delay = min(backoff_delay(attempt, base_delay, max_delay), remaining)
+            logging.warning(f"{os.path.basename(filepath)}: попытка {attempt + 1} не удалась ({e}), повтор через {delay:.1f} с")
+            time.sleep(delay)
+            attempt += 1
+    raise RuntimeError(f"Не удалось скачать {url} за {deadline} с: {last_error}")
+
+
+def download_gfs_radiation(dt, hour, grib_dir, base_url=NOMADS_URL,
+                           start_hour=START_HOUR, end_hour=END_HOUR, max_workers=8, **retry_kwargs):
+    """Параллельно скачивает шаги прогноза GFS f{start_hour}..f{end_hour} в grib_dir.
+
+    Уже скачанные и валидные файлы пропускаются. Возвращает список путей
+    успешно скачанных файлов; ошибки по отдельным файлам пишутся в лог.
+    """
+    os.makedirs(grib_dir, exist_ok=True)
+    url_dir = f"/gfs.{dt.strftime('%Y%m%d')}/{hour:02}/atmos"
+    jobs = {}
+    for step in range(start_hour, end_hour + 1):
+        filename = grib_filename(hour, step)
+        filepath = os.path.join(grib_dir, filename)
+        if is_valid_grib(filepath):
+            continue
+        url = f"{base_url}?" + FILTER_QUERY.format(filename, url_dir)
+        jobs[filepath] = url
+
+    done = []
+    if not jobs:
+        return done
+    with make_session(max_workers) as session:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(download_file, session, url, filepath, **retry_kwargs): filepath
+                for filepath, url in jobs.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    done.append(future.result())
+                except Exception as e:
+                    logging.error(f"Ошибка загрузки {futures[future]}: {e}")
+    return sorted(done)
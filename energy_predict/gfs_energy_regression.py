@@ -1,5 +1,6 @@
 # %%
 import os
+import sys
 import numpy as np
 import glob
 import xarray
@@ -13,45 +14,48 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score, \
     mean_absolute_error
 import xgboost as xgb
+from gfs_grib import load_radiation, discover_hours, to_local_time
+from features import window_features
+from clear_sky import clear_day_mask
+from dataset_store import DatasetStore, select, select_days
 from sklearn.preprocessing import StandardScaler
 
+CSV2DB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'csv2db')
+sys.path.append(CSV2DB_DIR)
+from observations import fetch_observations
+
 
 ROOT_DIR = "/home/kairat/Build_WRF/"
 ICBC_DIR = os.path.join(ROOT_DIR, "icbc")
+DATASET_DIR = "energy_dataset"
+OBS_SENSOR_IDS = [5]
+TARGET = 'energy_true'
 
 
-# %% 
-def read_gfs_data(file_path):
-    h = int(file_path[-2:])
-    offset = datetime.timedelta(hours=h+5)
-    delta = pd.Timedelta(offset)
-    data = xarray.open_dataset(file_path, engine='cfgrib', filter_by_keys={'typeOfLevel': 'surface'})
-    dt = pd.to_datetime(data['time'].values + delta)        # Date and Time
-    rad = data['sdswrf'].values        # Downward short-wave radiation flux, units: W m**-2 (Поток нисходящего коротковолнового излучения, ед.: Вт м**-2)
-    data.close()
-    return  dt, rad
+# %%
+def observations_frame(obs_time, obs_values, column):
+    """Наблюдения без пропусков, отрицательные значения обнуляются."""
+    mask = ~np.isnan(obs_values)
+    df_target = pd.DataFrame({column: np.maximum(obs_values[mask], 0)},
+                             index=pd.DatetimeIndex(obs_time[mask].astype('datetime64[ns]'), name='datetime'))
+    return df_target
 
 
 # %%
-def extract_data(start_date):
+def extract_data(start_date, obs):
     # GFS
     gfs_files_dir = os.path.join(ICBC_DIR, 'rad', f"{start_date.strftime('%Y%m%d')}")
-    data = []
-    for gfs_file_path in glob.glob(f"{gfs_files_dir}/*.f*"):
-        if os.path.isfile(gfs_file_path + ".5b7b6.idx"):
-            os.remove(gfs_file_path + ".5b7b6.idx")
-        if gfs_file_path[-4:] == '.idx':
-            continue
-        gfs_dt, gfs_rad = read_gfs_data(gfs_file_path)  
-        # plt.imshow(gfs_rad)
-        # plt.show()
-        x_hour = gfs_rad.ravel()
-        if (x_hour == 0).all():
-            continue
-        data.append([gfs_dt, x_hour])
-    if len(data) == 0:
+    frames = []
+    for hour in discover_hours(gfs_files_dir):
+        # Декодированные массивы кэшируются в .npz рядом с GRIB-файлами
+        gfs_time, gfs_rad = load_radiation(gfs_files_dir, hour)
+        X = gfs_rad.reshape(len(gfs_rad), -1)
+        mask = ~(X == 0).all(axis=1)
+        if mask.any():
+            frames.append(pd.DataFrame({'datetime': to_local_time(gfs_time[mask]), 'X': list(X[mask])}))
+    if len(frames) == 0:
         return pd.DataFrame()
-    df = pd.DataFrame(data, columns=['datetime', 'X'])
+    df = pd.concat(frames, ignore_index=True)
     df.set_index('datetime', inplace=True)
     
     # # OBS sensor 1
@@ -117,51 +121,42 @@ def extract_data(start_date):
     #     df_target.set_index('datetime', inplace=True)
     #     df = pd.merge(df, df_target, on="datetime", how="inner")
 
-    # energy_true sensor 5
-    url = f"http://213.5.184.182/get_data?sensor_id=5&start_date={df.index[0].strftime('%Y-%m-%d')}&end_date={df.index[-1].strftime('%Y-%m-%d')}&interval=60"
-    res = requests.get(url)
-    if res.status_code != 200:
-        return pd.DataFrame()
-    res_data = res.json()
-    if len(res_data['values']) == 0:
-        return pd.DataFrame()
-    obs_dt = np.array(res_data['time'], dtype=np.datetime64)
-    obs_rad = np.array(res_data['values'])
-    obs_rad[obs_rad<0] = 0
-    obs_data = np.array([obs_dt, obs_rad]).T    
-    df_target = pd.DataFrame(obs_data, columns=['datetime', 'energy_true'])
-    df_target.set_index('datetime', inplace=True)
-    df = pd.merge(df, df_target, on="datetime", how="inner")
+    # energy_true sensor 5 (часовые средние из БД, см. preprocessing_data)
+    obs_rad = obs.values[:, obs.sensor_ids.index(5)]
+    df = pd.merge(df, observations_frame(obs.time, obs_rad, 'energy_true'), on="datetime", how="inner")
 
     return df
 
 
 # %%
-def preprocessing_data(start_date, end_date,clear=True):
-    df = pd.DataFrame()
+def preprocessing_data(start_date, end_date, store, clear=True):
+    # Дни дописываются в store по одному; уже сохранённое время пропускается,
+    # поэтому повторный запуск по тому же диапазону безопасен.
+    # Наблюдения читаются из БД одним запросом на весь период
+    # (+2 дня: прогноз цикла покрывает следующие сутки)
+    obs = fetch_observations(OBS_SENSOR_IDS, start_date, end_date + datetime.timedelta(days=2))
     while start_date < end_date:
         try:
             # if start_date.strftime('%Y%m%d') != "20250617": 
             #     continue
             print('File:', start_date)
-            df_local = extract_data(start_date)
+            df_local = extract_data(start_date, obs)
             if len(df_local) > 0:
-                if clear:
-                    df = df.combine_first(df_local)
-                elif (not is_clear_day(df_local)):
-                    df = df.combine_first(df_local)
+                X = np.stack(df_local['X'].values)
+                if clear or not is_clear_day(X):
+                    store.append(df_local.index.values, X, {TARGET: df_local[TARGET].values})
         except Exception as e:
             print('Error:', start_date, e)
         finally:
             start_date += datetime.timedelta(days=1)
 
-    return df
+    return store.load()
 
 
 # %%
-def test(reg, df, delta_t=1):
-    X = np.array([np.hstack(df['X'].values[i-delta_t:i+delta_t+1]) for i in range(delta_t, len(df)-delta_t)])
-    Y = df['energy_true'].values[delta_t:-delta_t]
+def test(reg, ds, delta_t=1):
+    X = window_features(ds.X, delta_t, pad=False)
+    Y = ds.targets[TARGET][delta_t:-delta_t]
     # X = np.vstack(df['X'].values)
     # Y = df['target1'].values
     y_pred = reg.predict(X)
@@ -203,18 +198,17 @@ def test(reg, df, delta_t=1):
 
 
 # %%
-def predict(reg, df, delta_t=1):
-    for dt, group in df.groupby(df.index.date):   # группируем только по дате
+def predict(reg, ds, delta_t=1):
+    days = ds.time.astype('datetime64[D]')
+    for dt in np.unique(days):   # группируем только по дате
+        group = select(ds, days == dt)
         plt.figure(figsize=(8,4))
         plt.title(str(dt))
 
-        dt_label, y_pred, y_true, y_wrf_pred = [], [], [], []
-        for i in range(delta_t, len(group)-delta_t):
-            X = np.hstack(group['X'].values[i-delta_t:i+delta_t+1]).reshape(1, -1)
-            y = reg.predict(X)
-            dt_label.append(group.index[i])
-            y_pred.append(y)
-            y_true.append(group['target'].values[i])
+        X = window_features(group.X, delta_t, pad=False)
+        y_pred = reg.predict(X) if len(X) else []
+        dt_label = group.time[delta_t:len(group.time)-delta_t]
+        y_true = group.targets[TARGET][delta_t:len(group.time)-delta_t]
 
         plt.plot(dt_label, y_true, label=f'y_true')
         plt.plot(dt_label, y_pred, label=f'gfs_pred')
@@ -227,34 +221,23 @@ def predict(reg, df, delta_t=1):
 
 
 # %%
-def split_train_test(df, test_size=0.1, random_state=18):
+def split_train_test(ds, test_size=0.1, random_state=18):
     # Уникальные даты
-    unique_dates = df.index.normalize().unique()   # normalize -> обрезает время
+    unique_dates = np.unique(ds.time.astype('datetime64[D]'))
     # train/test split по датам
     train_dates, test_dates = train_test_split(unique_dates, test_size=test_size, random_state=random_state)
-    # Собираем обратно строки
-    train_df = df[df.index.normalize().isin(train_dates)]
-    test_df  = df[df.index.normalize().isin(test_dates)]
-        
-    return train_df, test_df
+    # Собираем обратно строки (копируются только выбранные дни)
+    return select_days(ds, train_dates), select_days(ds, test_dates)
 
 # %%
-def is_clear_day(fc_df, rad_max_treshold=600, rad_delta=20):
-    data = np.stack(fc_df['X'].values)
-    for x in range(data.shape[1]):
-        rad_max = np.max(data[:, x])
-        rad_max_n = np.argmax(data[:, x])
-        if any(np.diff(data[:, x])[:rad_max_n] < -rad_delta) or\
-            any(np.diff(data[:, x])[rad_max_n:] > rad_delta):
-            return False
-        if rad_max < rad_max_treshold:
-            return False
-    return True
+def is_clear_day(data, rad_max_treshold=600, rad_delta=20):
+    # Все ячейки сетки проверяются разом (data — (время, ячейки) или (дни, время, ячейки))
+    return clear_day_mask(data, rad_max_treshold, rad_delta)
 
 # %%
-def train(df, delta_t=1):
-    X = np.array([np.hstack(df['X'].values[i-delta_t:i+delta_t+1]) for i in range(delta_t, len(df)-delta_t)])
-    Y = df['energy_true'].values[delta_t:-delta_t]
+def train(ds, delta_t=1):
+    X = window_features(ds.X, delta_t, pad=False)
+    Y = ds.targets[TARGET][delta_t:-delta_t]
     # X = np.vstack(df['X'].values)
     # Y = df['target1'].values
     # reg = LinearRegression().fit(X, Y)
@@ -274,11 +257,11 @@ def train(df, delta_t=1):
 # start_date = datetime.datetime(2025, 2, 1)
 # # start_date = datetime.datetime(2025, 8, 24)
 # end_date= datetime.datetime(2025, 12, 16)
-# df = preprocessing_data(start_date, end_date, clear=True)
-# df.to_pickle('energy_dataset.pkl')
+# df = preprocessing_data(start_date, end_date, DatasetStore(DATASET_DIR), clear=True)
+# Перенос старого energy_dataset.pkl: python dataset_store.py energy_dataset.pkl energy_dataset
             
 # %% 
-df = pd.read_pickle('energy_dataset.pkl')
+df = DatasetStore(DATASET_DIR).load()
 # df = pd.read_pickle('noclear_energy_dataset.pkl')
 # test_df = pd.read_pickle('test_noclear_wrf_rad_dataset.pkl')
 
@@ -314,7 +297,8 @@ test(reg, df_test, delta_t=2)
 # # %%
 
 # %%
-import pickle
-pickle.dump(reg, open('energy_xtr_model.pkl', "wb"))
+import joblib
+# joblib хранит массивы деревьев отдельно, что позволяет грузить модель с mmap_mode
+joblib.dump(reg, 'energy_xtr_model.pkl')
 
 # %%
\ No newline at end of file
@@ -0,0 +1,93 @@
+import os
+import glob
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import xarray as xr
+from gfs_download import START_HOUR, END_HOUR, grib_filename
+
+
+FILTER_KEYS = {'typeOfLevel': 'surface', 'stepType': 'avg'}
+
+
+def grib_files(grib_dir, hour, start_hour=START_HOUR, end_hour=END_HOUR):
+    """Пути к шагам прогноза цикла hour; список обрывается на первом отсутствующем файле."""
+    files = []
+    for i in range(start_hour, end_hour + 1):
+        grib_file = os.path.join(grib_dir, grib_filename(hour, i))
+        if not os.path.isfile(grib_file):
+            break
+        files.append(grib_file)
+    return files
+
+
+def cache_path(grib_dir, hour):
+    return os.path.join(grib_dir, f"sdswrf.t{hour:02}z.npz")
+
+
+def decode_radiation(files):
+    """Декодирует sdswrf из нескольких GRIB-файлов за одно открытие cfgrib.
+
+    GRIB допускает конкатенацию сообщений, поэтому файлы склеиваются во
+    временный файл и открываются одним xr.open_dataset (один индекс cfgrib).
+    Возвращает (valid_time UTC datetime64[s], rad float32 формы (time, lat, lon)).
+    """
+    grib_dir = os.path.dirname(files[0])
+    fd, merged_path = tempfile.mkstemp(dir=grib_dir, suffix='.grib2')
+    try:
+        with os.fdopen(fd, 'wb') as merged:
+            for path in files:
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, merged)
+        with xr.open_dataset(merged_path, engine='cfgrib',
+                             backend_kwargs={'filter_by_keys': FILTER_KEYS, 'indexpath': ''}) as ds:
+            valid_time = np.atleast_1d(ds['valid_time'].values).astype('datetime64[s]')
+            # новые версии ecCodes называют осреднённый поток avg_sdswrf
+            name = 'sdswrf' if 'sdswrf' in ds else 'avg_sdswrf'
+            rad = np.ascontiguousarray(ds[name].values, dtype=np.float32)
+    finally:
+        os.remove(merged_path)
+    if rad.ndim == 2:
+        rad = rad[np.newaxis]
+    order = np.argsort(valid_time)
+    return valid_time[order], rad[order]
+
+
+def load_radiation(grib_dir, hour, start_hour=START_HOUR, end_hour=END_HOUR, use_cache=True):
+    """sdswrf цикла hour из grib_dir с кэшем декодированного массива в .npz.
+
+    Кэш пишется только для полного набора шагов и считается актуальным,
+    пока он новее всех GRIB-файлов. Возвращает (valid_time, rad) как decode_radiation.
+    """
+    files = grib_files(grib_dir, hour, start_hour, end_hour)
+    if not files:
+        return np.array([], dtype='datetime64[s]'), np.empty((0, 0, 0), dtype=np.float32)
+
+    cache_file = cache_path(grib_dir, hour)
+    complete = len(files) == end_hour - start_hour + 1
+    if use_cache and complete and os.path.isfile(cache_file):
+        cache_mtime = os.path.getmtime(cache_file)
+        if all(os.path.getmtime(f) <= cache_mtime for f in files):
+            with np.load(cache_file) as cached:
+                return cached['time'], cached['rad']
+
+    valid_time, rad = decode_radiation(files)
+    if use_cache and complete:
+        fd, tmp_path = tempfile.mkstemp(dir=grib_dir, suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, time=valid_time, rad=rad)
+        os.replace(tmp_path, cache_file)
+    return valid_time, rad
+
+
+def discover_hours(grib_dir):
+    """Циклы GFS (часы), для которых в каталоге есть файлы."""
+    hours = set()
+    for path in glob.glob(os.path.join(grib_dir, "gfs.t*z.pgrb2.0p25.f*")):
+        hours.add(int(os.path.basename(path)[5:7]))
+    return sorted(hours)
+
+
+def to_local_time(valid_time, time_zone=5):
+    return pd.to_datetime(valid_time) + pd.Timedelta(hours=time_zone)
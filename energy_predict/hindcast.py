@@ -0,0 +1,69 @@
+import argparse
+import datetime
+import logging
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from main import read_cycle, publish_to_db, LOG_FORMAT
+from regression import RadRegressionModel, EnergyRegressionModel, model_registry
+
+
+def date_range(start_date, end_date):
+    return [start_date + datetime.timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+
+def load_cycle(cycle):
+    """Воркер пула: декодирует (кэшированные) GRIB цикла (дата, час)."""
+    dt, hour = cycle
+    try:
+        local_time, rad = read_cycle(dt, hour)
+    except Exception as e:
+        logging.error(f"Цикл {dt:%Y-%m-%d} {hour:02}z пропущен: {e}")
+        return cycle, None, None
+    return cycle, np.asarray(local_time, dtype='datetime64[s]'), rad
+
+
+def run_hindcast(start_date, end_date, hours, max_workers=None):
+    """Прогноз радиации и энергии по всем циклам диапазона дат.
+
+    GRIB декодируются параллельно в пуле процессов, обе модели вызываются
+    один раз на общей матрице признаков. Возвращает DataFrame с колонками
+    DateTime, rad, P; при пересечении циклов остаётся более поздний.
+    """
+    cycles = [(dt, hour) for dt in date_range(start_date, end_date) for hour in sorted(hours)]
+    # модели загружаются до создания пула: воркеры наследуют их при fork
+    model_registry.warm_up()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        loaded = [(times, rad) for _, times, rad in pool.map(load_cycle, cycles) if rad is not None and len(rad)]
+    if not loaded:
+        return pd.DataFrame(columns=['DateTime', 'rad', 'P'])
+
+    rads = [rad for _, rad in loaded]
+    df = pd.DataFrame({
+        'DateTime': np.concatenate([times for times, _ in loaded]),
+        'rad': RadRegressionModel().predict_batch(rads),
+        'P': EnergyRegressionModel().predict_batch(rads),
+    })
+    logging.info(f"Hindcast: {len(loaded)} из {len(cycles)} циклов, {len(df)} значений")
+    return df.drop_duplicates('DateTime', keep='last').sort_values('DateTime', ignore_index=True)
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пересчёт прогнозов (hindcast) по сохранённым GRIB GFS")
+    parser.add_argument("start", type=parse_date, help="первая дата цикла, YYYY-MM-DD")
+    parser.add_argument("end", type=parse_date, help="последняя дата цикла, YYYY-MM-DD")
+    parser.add_argument("--hours", type=int, nargs="+", default=[6], help="часы циклов GFS (по умолчанию 6)")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов для декодирования GRIB")
+    parser.add_argument("--dry-run", action="store_true", help="не писать в БД, только вывести итог")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    df = run_hindcast(args.start, args.end, args.hours, args.workers)
+    if args.dry_run:
+        print(df)
+    elif not df.empty:
+        publish_to_db(df)
@@ -1,7 +1,6 @@
 import os
+import sys
 import time
-import shutil
-import requests
 import datetime
 import xarray as xr
 import numpy as np
@@ -16,69 +15,41 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 # MIMEApplication attaching application-specific data (like CSV files) to email messages.
 from email.mime.application import MIMEApplication
-from regression import RadRegressionModel, EnergyRegressionModel
-
-logging.basicConfig(level=logging.INFO, filename="/home/kairat/Burnoe/energy_predict/main.log", filemode="a",
-                    format="%(asctime)s %(levelname)s %(message)s")
+from regression import RadRegressionModel, EnergyRegressionModel, model_registry
+from gfs_download import download_gfs_radiation
+from gfs_grib import load_radiation, to_local_time, START_HOUR, END_HOUR
 
+LOG_FILE = "/home/kairat/Burnoe/energy_predict/main.log"
+LOG_FORMAT = "%(asctime)s %(levelname)s %(message)s"
 
 ROOT_DIR = "/home/kairat/Build_WRF/"
 ICBC_DIR = os.path.join(ROOT_DIR, "icbc")
 OUT_DIR = os.path.join(ROOT_DIR, "out/Burnoe")
+CSV2DB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "csv2db")
 
  
 
+def rad_grib_dir(dt):
+    return os.path.join(ICBC_DIR, 'rad', f"{dt.strftime('%Y%m%d')}")
+
+
 def download_radiation(dt, hour):
-    start_hour = 18
-    end_hour = 33
-    grib_dir = os.path.join(ICBC_DIR, 'rad', f"{dt.strftime('%Y%m%d')}")
-    os.makedirs(ICBC_DIR, exist_ok=True)
-    os.makedirs(grib_dir, exist_ok=True)
-    url_dir = f"/gfs.{dt.strftime('%Y%m%d')}/{hour:02}/atmos"
-    url_template = "https://nomads.ncep.noaa.gov/cgi-bin/filter_gfs_0p25.pl?file={0}\
-&lev_surface=on&var_DSWRF=on&subregion=&leftlon=69&rightlon=72.6&toplat=44&bottomlat=41.4\
-&dir={1}"
-    for i in range(start_hour, end_hour+1):
-        filename = f"gfs.t{hour:02}z.pgrb2.0p25.f{i:03}"
-        url = url_template.format(filename, url_dir)
-        filepath = os.path.join(grib_dir, filename)
-        if not os.path.isfile(filepath):
-            for i in range(30):
-                try:
-                    with requests.get(url, stream=True) as r:
-                        with open(filepath, 'wb') as f:
-                            shutil.copyfileobj(r.raw, f)
-                    break
-                except:
-                    time.sleep(30)
+    download_gfs_radiation(dt, hour, rad_grib_dir(dt))
     logging.info("Данные радиации скачены")
-    
 
-def read_grib(grib_file):
-    ds_sfc = xr.open_dataset(grib_file, engine='cfgrib', filter_by_keys={'typeOfLevel': 'surface', 'stepType': 'avg'})
-    time = pd.to_datetime(ds_sfc['time'].values)
-    rad = ds_sfc['sdswrf'].values.ravel()
-    ds_sfc.close()
-    return time, rad
-
-
-def read_rad_data(dt):
-    time_zone = 5
-    start_hour = 18
-    end_hour = 33
-    grib_dir = os.path.join(ICBC_DIR, 'rad', f"{dt.strftime('%Y%m%d')}")
-    time_list = []
-    data_list = []
-    for i in range(start_hour, end_hour+1):
-        filename = f"gfs.t{hour:02}z.pgrb2.0p25.f{i:03}"
-        grib_file = os.path.join(grib_dir, filename)
-        if not os.path.isfile(grib_file):
-            logging.error("File not found:", grib_file)
-            break
-        time, data = read_grib(grib_file)
-        time_list.append(time + datetime.timedelta(hours=time_zone+i))
-        data_list.append(data)
-    df = pd.DataFrame({'DateTime': time_list, 'rad': data_list})
+
+def read_cycle(dt, hour, time_zone=5):
+    """Радиация GFS цикла hour за дату dt: (местное время, массив (шаги, lat*lon))."""
+    grib_dir = rad_grib_dir(dt)
+    valid_time, rad = load_radiation(grib_dir, hour, START_HOUR, END_HOUR)
+    if len(valid_time) < END_HOUR - START_HOUR + 1:
+        logging.error(f"Не все файлы GFS найдены в {grib_dir}: {len(valid_time)} из {END_HOUR - START_HOUR + 1}")
+    return to_local_time(valid_time, time_zone), rad.reshape(rad.shape[0], int(np.prod(rad.shape[1:])))
+
+
+def read_rad_data(dt, hour):
+    local_time, rad = read_cycle(dt, hour)
+    df = pd.DataFrame({'DateTime': local_time, 'rad': list(rad)})
     df['Time'] = df['DateTime'].dt.time
     return df
 
@@ -106,46 +77,18 @@ def save_to_file(df, suffix, fc_date):
     logging.info(f"Результаты сохранены в файлы {csv_out_path} и {jpg_out_path}")
 
 
-def login_to_db():
-    login_url = 'http://127.0.0.1:5050/login'
-    # Используем requests.Session для сохранения куки сессии
-    session = requests.Session()
-    # Эмулируем форму логина (такой же формат, как <form method="POST">)
-    login_data = {
-        'username': 'admin',
-        'password': 'Burnoe-123'
-    }
-    # Выполняем логин
-    login_response = session.post(login_url, data=login_data)
-    if login_response.status_code != 200 or 'Загрузка данных в базу данных' not in login_response.text:
-        logging.info('Не удалось войти в систему')
-        return None
-    logging.info('Авторизация успешна')
-    return session
-
-
-def run_sending_to_db(fc_datetime):
-    session = login_to_db()
-    if session is None:
-        return
-    
-    # Sending forecast data
-    irrad_csv_file_path = os.path.join(OUT_DIR, f"irrad_{fc_datetime}.csv")
-    energy_csv_file_path = os.path.join(OUT_DIR, f"energy_{fc_datetime}.csv")
-    
-    if os.path.isfile(irrad_csv_file_path) and os.path.isfile(irrad_csv_file_path):
-        csv_files = [('forecastFile', (irrad_csv_file_path, open(irrad_csv_file_path, 'rb'))), 
-                     ('forecastFile', (energy_csv_file_path, open(energy_csv_file_path, 'rb')))]
+def publish_to_db(df):
+    """Записывает прогноз (колонки DateTime, rad, P) напрямую в БД csv2db одной транзакцией."""
+    if CSV2DB_DIR not in sys.path:
+        sys.path.append(CSV2DB_DIR)
+    from forecast_publish import publish_forecasts
 
-        url = f"http://127.0.0.1:5050/upload_forecast"
-        try:
-            res = session.post(url, files=csv_files)
-            if res.status_code == 200:
-                logging.info(f"Результаты прогноза отправлены в БД")
-            else:
-                logging.error(f"Ошибка при отправке результатов прогноза в БД: {res.status_code} {res.text}")
-        except Exception as ex:
-            logging.exception("ERROR", ex)
+    total = publish_forecasts({
+        "Forecast Radiation": (df['DateTime'], df['rad']),
+        "Forecast Energy": (df['DateTime'], df['P']),
+    })
+    logging.info(f"Результаты прогноза записаны в БД: {total} значений")
+    return total
 
 
 def run_sending_email(fc_datetime):
@@ -202,13 +145,15 @@ def run_sending_email(fc_datetime):
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, filename=LOG_FILE, filemode="a", format=LOG_FORMAT)
     dt = datetime.datetime.now() - datetime.timedelta(days=0)  
     hour = 6
 
     logging.info(f"Запущено: {dt.strftime('%Y-%m-%d')}")
+    model_registry.warm_up()
 
     download_radiation(dt, hour)
-    df_rad = read_rad_data(dt)
+    df_rad = read_rad_data(dt, hour)
     rad_pred = run_rad_prediction(df_rad)
     energy_pred = run_energy_prediction(df_rad)
     
@@ -219,5 +164,5 @@ if __name__ == "__main__":
     save_to_file(energy_pred[['Time', 'P']], 'energy', fc_date)
 
     # run_sending_email(fc_date)
-    run_sending_to_db(fc_date)
+    publish_to_db(rad_pred[['DateTime', 'rad']].assign(P=energy_pred['P']))
     
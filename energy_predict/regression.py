@@ -1,43 +1,96 @@
 import os
 import pickle
+import logging
+import threading
 import numpy as np
+from features import window_features
 
+try:
+    import joblib
+except ImportError:
+    joblib = None
 
-class RadRegressionModel():
 
-    def __init__(self):
-        self.model = pickle.load(open(os.path.join(os.path.dirname(os.path.abspath(__file__)),'rad_xtr_model.pkl'), "rb"))
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+RAD_MODEL_FILE = 'rad_xtr_model.pkl'
+ENERGY_MODEL_FILE = 'energy_xtr_model.pkl'
 
 
-    def predict(self, df, delta_t=2):
-        rad = np.vstack(df['rad'].values)
-        T, F = rad.shape
-        pad = np.zeros((delta_t, F))
-        rad_pad = np.vstack([pad, rad, pad])
-        windows = [
-            rad_pad[i : i + 2 * delta_t + 1].reshape(-1)
-            for i in range(T)
-        ]
-        X = np.array(windows)
-        y_pred = self.model.predict(X)
-        return y_pred
+def load_model(path, mmap_mode=None):
+    """Загружает модель: через joblib (с mmap_mode для массивов деревьев), иначе pickle."""
+    if joblib is not None:
+        return joblib.load(path, mmap_mode=mmap_mode)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+class ModelRegistry():
+    """Загруженные модели на процесс: каждый файл читается с диска один раз.
+
+    mmap_mode='r' лишь избавляет от лишнего копирования файла при загрузке:
+    деревья sklearn всё равно переносят массивы узлов в собственные буферы.
+    Общими между процессами модели становятся, если загрузить их (warm_up)
+    до fork — тогда дочерние процессы получают страницы copy-on-write.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, mmap_mode='r'):
+        self.model_dir = model_dir
+        self.mmap_mode = mmap_mode
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def get(self, filename):
+        with self._lock:
+            model = self._models.get(filename)
+            if model is None:
+                path = os.path.join(self.model_dir, filename)
+                model = load_model(path, self.mmap_mode)
+                self._models[filename] = model
+                logging.info(f"Модель {filename} загружена")
+            return model
+
+    def warm_up(self, filenames=(RAD_MODEL_FILE, ENERGY_MODEL_FILE)):
+        """Загружает модели и делает пробный predict, чтобы первый прогноз не ждал."""
+        for filename in filenames:
+            model = self.get(filename)
+            n_features = getattr(model, 'n_features_in_', None)
+            if n_features is not None:
+                model.predict(np.zeros((1, n_features), dtype=np.float32))
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
 
 
-class EnergyRegressionModel():
+model_registry = ModelRegistry()
 
-    def __init__(self):
-        self.model = pickle.load(open(os.path.join(os.path.dirname(os.path.abspath(__file__)),'energy_xtr_model.pkl'), "rb"))
+
+class RegressionModel():
+    model_file = None
+
+    def __init__(self, registry=model_registry):
+        self.model = registry.get(self.model_file)
 
 
     def predict(self, df, delta_t=2):
-        rad = np.vstack(df['rad'].values)
-        T, F = rad.shape
-        pad = np.zeros((delta_t, F))
-        rad_pad = np.vstack([pad, rad, pad])
-        windows = [
-            rad_pad[i : i + 2 * delta_t + 1].reshape(-1)
-            for i in range(T)
-        ]
-        X = np.array(windows)
+        X = window_features(np.vstack(df['rad'].values), delta_t)
         y_pred = self.model.predict(X)
         return y_pred
+
+
+    def predict_batch(self, rads, delta_t=2):
+        """Прогноз сразу для нескольких циклов: rads — список массивов (шаги, признаки).
+
+        Окна строятся внутри каждого цикла, затем все циклы предсказываются
+        одним вызовом модели; результат идёт подряд в том же порядке.
+        """
+        X = np.vstack([window_features(rad, delta_t) for rad in rads])
+        return self.model.predict(X)
+
+
+class RadRegressionModel(RegressionModel):
+    model_file = RAD_MODEL_FILE
+
+
+class EnergyRegressionModel(RegressionModel):
+    model_file = ENERGY_MODEL_FILE
@@ -1,28 +1,49 @@
 import pandapower as pp
-import math
+import numpy as np
 from pandapower.plotting import simple_plot
 
 
+# Функции расчёта параметров линии принимают как скаляры, так и массивы NumPy
+# (с broadcasting), что позволяет оценивать сразу много вариантов проводников.
+
 def calculate_radius(S_mm2):
-    S_m2 = S_mm2 * 1e-6 
-    return math.sqrt(S_m2 / math.pi)
+    S_m2 = np.asarray(S_mm2, dtype=float) * 1e-6
+    return np.sqrt(S_m2 / np.pi)
 
 def calculate_active_resistance(rho, L_m, S_mm2):
-    return (rho * L_m) / S_mm2  # Ом
+    return (rho * np.asarray(L_m, dtype=float)) / np.asarray(S_mm2, dtype=float)  # Ом
 
 def calculate_inductive_reactance(mu_0, D, r, f, L_m):
-    L_inductance = (mu_0 / (2 * math.pi)) * math.log(D / r)
-    X_L_ohm = 2 * math.pi * f * L_inductance * L_m  # Ом
-    X_L_ohm_km = 2 * math.pi * f * L_inductance * 1000  # Ом/км
+    L_inductance = (mu_0 / (2 * np.pi)) * np.log(np.asarray(D, dtype=float) / r)
+    X_L_ohm = 2 * np.pi * np.asarray(f, dtype=float) * L_inductance * L_m  # Ом
+    X_L_ohm_km = 2 * np.pi * np.asarray(f, dtype=float) * L_inductance * 1000  # Ом/км
     return X_L_ohm, X_L_ohm_km
 
 def calculate_capacitance(epsilon, D, r, L_m):
-    C_farad = (2 * math.pi * epsilon) / math.log(D / r)
+    C_farad = (2 * np.pi * epsilon) / np.log(np.asarray(D, dtype=float) / r)
     C_nF = C_farad * 1e9 * L_m  # нФ
     C_nF_km = C_farad * 1e9 * 1000  # нФ/км
     return C_nF, C_nF_km
 
-def create_and_run_network(U, num_nodes, P, Q, Ped_g, cosf_g, rho, L_m, S_mm2, D, f, epsilon, mu_0):
+def calculate_line_parameters(S_mm2, D, L_m, f, rho, epsilon, mu_0):
+    """Погонные параметры для массивов вариантов (S_mm2, D, L_m, f).
+
+    Возвращает (r_ohm_per_km, x_ohm_per_km, c_nf_per_km) — массивы общей формы
+    после broadcasting входов.
+    """
+    S_mm2, D, L_m, f = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (S_mm2, D, L_m, f)))
+    r = calculate_radius(S_mm2)
+    R_ohm = calculate_active_resistance(rho, L_m, S_mm2)
+    _, X_L_ohm_km = calculate_inductive_reactance(mu_0, D, r, f, L_m)
+    _, C_nF_km = calculate_capacitance(epsilon, D, r, L_m)
+    return 1000 * R_ohm / L_m, X_L_ohm_km, C_nF_km
+
+def create_network(U, num_nodes, rho, L_m, S_mm2, D, f, epsilon, mu_0, cosf_g=1):
+    """Строит радиальную сеть из num_nodes участков линии без расчёта потокораспределения.
+
+    Нагрузки и генерация создаются с нулевой мощностью и задаются потом
+    через set_injections, поэтому одну сеть можно пересчитывать на каждом шаге.
+    """
     # Расчет параметров
     r = calculate_radius(S_mm2)
     R_ohm = calculate_active_resistance(rho, L_m, S_mm2)
@@ -50,21 +71,54 @@ def create_and_run_network(U, num_nodes, P, Q, Ped_g, cosf_g, rho, L_m, S_mm2, D
     for i in range(num_nodes):
         pp.create_line(net, from_bus=buses[i], to_bus=buses[i + 1], length_km=(L_m / 1000), std_type="line_type")
 
-
-    load_per_node_p = P / num_nodes  
-    load_per_node_q = Q / num_nodes  
+    for i in range(1, num_nodes + 1):
+        pp.create_load(net, buses[i], p_mw=0.0, q_mvar=0.0)
 
     for i in range(1, num_nodes + 1):
-        pp.create_load(net, buses[i], p_mw=(load_per_node_p / 1e6), q_mvar=(load_per_node_q / 1e6))
+        pp.create_sgen(net, buses[i], p_mw=0.0, vm_pu=cosf_g)
 
+    return net, R_ohm, X_L_ohm, C_nF
 
-    load_per_node_p_g = Ped_g / num_nodes  
-    for i in range(1, num_nodes + 1):
-        pp.create_sgen(net, buses[i], p_mw=(load_per_node_p_g / 1e6), vm_pu=cosf_g)
 
-   
-    pp.runpp(net, numba=False)
+def set_injections(net, P, Q, Ped_g):
+    """Задаёт суммарные нагрузку P, Q и генерацию Ped_g (Вт, вар), поровну на узлы."""
+    net.load["p_mw"] = P / len(net.load) / 1e6
+    net.load["q_mvar"] = Q / len(net.load) / 1e6
+    net.sgen["p_mw"] = Ped_g / len(net.sgen) / 1e6
+
+
+def run_step(net, P, Q, Ped_g):
+    """Один шаг расчёта на уже построенной сети.
+
+    Начиная со второго шага расчёт стартует от предыдущего решения (init="results").
+    """
+    set_injections(net, P, Q, Ped_g)
+    init = "results" if net.get("converged", False) else "auto"
+    pp.runpp(net, numba=False, init=init)
+    return net
+
 
+def run_time_series(net, P, Q, Ped_g):
+    """Потокораспределение для рядов P, Q, Ped_g (скаляры или массивы по шагам).
+
+    Сеть строится один раз снаружи (create_network); на каждом шаге меняются
+    только p_mw/q_mvar. Возвращает (vm_pu (шаги, шины), pl_mw (шаги, линии)).
+    """
+    P, Q, Ped_g = np.broadcast_arrays(np.asarray(P, dtype=float), np.asarray(Q, dtype=float),
+                                      np.asarray(Ped_g, dtype=float))
+    P, Q, Ped_g = np.atleast_1d(P), np.atleast_1d(Q), np.atleast_1d(Ped_g)
+    vm_pu = np.empty((len(P), len(net.bus)))
+    pl_mw = np.empty((len(P), len(net.line)))
+    for step in range(len(P)):
+        run_step(net, P[step], Q[step], Ped_g[step])
+        vm_pu[step] = net.res_bus["vm_pu"].values
+        pl_mw[step] = net.res_line["pl_mw"].values
+    return vm_pu, pl_mw
+
+
+def create_and_run_network(U, num_nodes, P, Q, Ped_g, cosf_g, rho, L_m, S_mm2, D, f, epsilon, mu_0):
+    net, R_ohm, X_L_ohm, C_nF = create_network(U, num_nodes, rho, L_m, S_mm2, D, f, epsilon, mu_0, cosf_g)
+    run_step(net, P, Q, Ped_g)
     return net, R_ohm, X_L_ohm, C_nF
 
 def print_results(net, U, R_ohm, X_L_ohm, C_nF, L_m):
@@ -1,7 +1,10 @@
 import asyncio
+import os
 import random
 import math
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from itertools import count
 from datetime import datetime
 import pandas as pd
@@ -51,16 +54,56 @@ solar_data['power_generation'] = solar_data['rad'].apply(solar_radiation_to_powe
 calculated_voltages = [0] * num_nodes
 
 # ---------------------- Асинхронная симуляция сигналов (из signal_test_v2.py) ----------------------
-signal_history_data = []
-signal_reception_data = []
+HISTORY_MAXLEN = 10000   # последних событий в памяти (кольцевые буферы)
+PLOT_MAXLEN = 1000       # последних точек на узел для графика
+FLUSH_INTERVAL = 10      # секунд между сбросами журналов на диск
+SIGNAL_HISTORY_FILE = "signal_history.csv"
+SIGNAL_RECEPTION_FILE = "signal_reception.csv"
+
+signal_history_data = deque(maxlen=HISTORY_MAXLEN)
+signal_reception_data = deque(maxlen=HISTORY_MAXLEN)
+# События, ещё не записанные на диск, по файлам журналов
+pending_records = {SIGNAL_HISTORY_FILE: [], SIGNAL_RECEPTION_FILE: []}
+
+# Потокораспределение и запись файлов выполняются вне цикла событий;
+# по одному потоку, чтобы расчёты над одной сетью и дозапись файлов шли по очереди
+power_flow_executor = ThreadPoolExecutor(max_workers=1)
+io_executor = ThreadPoolExecutor(max_workers=1)
+
+def record_event(buffer, path, record):
+    buffer.append(record)
+    pending_records[path].append(record)
 
 async def log_signal_history(node_id, message):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-    signal_history_data.append({"Timestamp": timestamp, "Node": node_id + 1, "Message": message})
+    record_event(signal_history_data, SIGNAL_HISTORY_FILE,
+                 {"Timestamp": timestamp, "Node": node_id + 1, "Message": message})
 
 async def log_signal_reception(node_id, voltage):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-    signal_reception_data.append({"Timestamp": timestamp, "Node": node_id + 1, "Voltage": voltage})
+    record_event(signal_reception_data, SIGNAL_RECEPTION_FILE,
+                 {"Timestamp": timestamp, "Node": node_id + 1, "Voltage": voltage})
+
+def take_pending():
+    """Забирает накопленные события (вызывается из цикла событий)."""
+    batches = {path: records for path, records in pending_records.items() if records}
+    for path in batches:
+        pending_records[path] = []
+    return batches
+
+def write_batches(batches):
+    """Дописывает пачки событий в CSV; заголовок пишется только в пустой файл."""
+    for path, records in batches.items():
+        header = not os.path.isfile(path) or os.path.getsize(path) == 0
+        pd.DataFrame(records).to_csv(path, mode="a", header=header, index=False)
+
+async def flush_periodically(interval=FLUSH_INTERVAL):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        batches = take_pending()
+        if batches:
+            await loop.run_in_executor(io_executor, write_batches, batches)
 
 # Функция симуляции отправки сигнала с узла; вместо генерации случайного напряжения здесь берётся значение из calculated_voltages.
 async def simulate_node_signal(node_id, x_vals, y_vals, indices, lock):
@@ -102,8 +145,8 @@ async def simulate_node_signal(node_id, x_vals, y_vals, indices, lock):
 
 # Функция, запускающая симуляцию сигналов для всех узлов
 async def simulate_voltage_signals(node_count):
-    x_vals = {node: [] for node in range(node_count)}
-    y_vals = {node: [] for node in range(node_count)}
+    x_vals = {node: deque(maxlen=PLOT_MAXLEN) for node in range(node_count)}
+    y_vals = {node: deque(maxlen=PLOT_MAXLEN) for node in range(node_count)}
     indices = {node: count() for node in range(node_count)}
 
     lock = asyncio.Lock()
@@ -112,17 +155,23 @@ async def simulate_voltage_signals(node_count):
     tasks = [simulate_node_signal(node_id, x_vals, y_vals, indices, lock) for node_id in range(node_count)]
     update_task = asyncio.create_task(update_calculated_voltages())
     timer_task = asyncio.create_task(show_runtime())
+    flush_task = asyncio.create_task(flush_periodically())
 
-    await asyncio.gather(*tasks, update_task, timer_task)
+    await asyncio.gather(*tasks, update_task, timer_task, flush_task)
 
 # Функция обновления рассчитанных напряжений по данным солнечной радиации
 async def update_calculated_voltages():
     global calculated_voltages
+    loop = asyncio.get_running_loop()
+    # Сеть строится один раз; на каждом шаге обновляются только мощности.
+    # Расчёт идёт в отдельном потоке и не блокирует корутины узлов
+    net, R_ohm, X_L_ohm, C_nF = await loop.run_in_executor(
+        power_flow_executor, pn.create_network,
+        U, num_nodes, rho, L_m, S_mm2, D, f, epsilon, mu_0, cosf_g)
     for index, row in solar_data.iterrows():
         P_g_interval = row['power_generation']
-        net, R_ohm, X_L_ohm, C_nF = pn.create_and_run_network(
-            U, num_nodes, load_variation(), Q, P_g_interval, cosf_g,
-            rho, L_m, S_mm2, D, f, epsilon, mu_0)
+        await loop.run_in_executor(
+            power_flow_executor, pn.run_step, net, load_variation(), Q, P_g_interval)
         voltage_values = get_voltage_values(net)
         calculated_voltages = list(voltage_values)
         print(f"Время {row['datetime']}: Генерация мощности = {P_g_interval:.2f} Вт, Напряжения в узлах = {calculated_voltages}")
@@ -140,9 +189,14 @@ async def main(node_count):
     await simulate_voltage_signals(node_count)
 
 if __name__ == "__main__":
+    # Журналы каждого запуска начинаются с пустых файлов и дописываются пачками
+    for path in pending_records:
+        open(path, "w").close()
     try:
         asyncio.run(main(num_nodes))
     finally:
-        # Сохранение логов в CSV по завершении работы
-        pd.DataFrame(signal_history_data).to_csv("signal_history.csv", index=False)
-        pd.DataFrame(signal_reception_data).to_csv("signal_reception.csv", index=False)
+        # Сохранение оставшихся событий по завершении работы: сначала дожидаемся
+        # начатой фоновой записи, чтобы пачки не перемешались в файлах
+        power_flow_executor.shutdown(wait=False)
+        io_executor.shutdown(wait=True)
+        write_batches(take_pending())
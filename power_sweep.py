@@ -0,0 +1,125 @@
+import math
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pandapower as pp
+
+import power_network as pn
+
+# Параметры линии по умолчанию (как в def_model.py)
+LINE_DEFAULTS = {
+    "rho": 0.01724,
+    "D": 0.4,
+    "f": 50,
+    "epsilon": 8.854e-12,
+    "mu_0": 4 * math.pi * 1e-7,
+}
+U_DEFAULT = 400
+
+
+def solar_radiation_to_power(radiation, efficiency=0.2, area=10):
+    return radiation * efficiency * area
+
+
+def _run_config(job):
+    """Воркер пула: одна топология (num_nodes, S_mm2, L_m), все площади СЭС.
+
+    Сеть строится один раз; для каждой площади и шага меняются только мощности.
+    Шаги, где расчёт не сошёлся, остаются NaN.
+    """
+    (num_nodes, S_mm2, L_m), pv_areas, radiation, load_p, load_q, U, line_params = job
+    net, _, _, _ = pn.create_network(
+        U, num_nodes, line_params["rho"], L_m, S_mm2, line_params["D"], line_params["f"],
+        line_params["epsilon"], line_params["mu_0"])
+    steps = len(radiation)
+    vm_pu = np.full((len(pv_areas), steps, num_nodes + 1), np.nan)
+    pl_mw = np.full((len(pv_areas), steps, num_nodes), np.nan)
+    for k, area in enumerate(pv_areas):
+        generation = solar_radiation_to_power(radiation, area=area)
+        for step in range(steps):
+            try:
+                pn.run_step(net, load_p[step], load_q[step], generation[step])
+            except pp.LoadflowNotConverged:
+                continue
+            vm_pu[k, step] = net.res_bus["vm_pu"].values
+            pl_mw[k, step] = net.res_line["pl_mw"].values
+    return vm_pu, pl_mw
+
+
+def run_sweep(radiation, num_nodes_list, S_mm2_list, L_m_list, pv_area_list,
+              load_p, load_q=0.0, step_hours=1.0, U=U_DEFAULT, max_workers=None, **line_params):
+    """Перебор сценариев сети по сетке параметров в пуле процессов.
+
+    radiation — ряд радиации (Вт/м²) по шагам, load_p/load_q — суммарная
+    нагрузка (скаляр или ряд той же длины), step_hours — длительность шага, ч.
+    Площадь СЭС pv_area (м² на сеть) задаёт долю генерации.
+    Возвращает словарь колоночных массивов:
+    параметры сценариев (n,), vm_pu (n, шаги, шины) и pl_mw (n, шаги, линии),
+    дополненные NaN до максимального числа узлов.
+    """
+    line_params = {**LINE_DEFAULTS, **line_params}
+    radiation = np.asarray(radiation, dtype=float)
+    load_p = np.broadcast_to(np.asarray(load_p, dtype=float), radiation.shape)
+    load_q = np.broadcast_to(np.asarray(load_q, dtype=float), radiation.shape)
+    pv_areas = list(pv_area_list)
+    configs = list(itertools.product(num_nodes_list, S_mm2_list, L_m_list))
+    jobs = [(config, pv_areas, radiation, load_p, load_q, U, line_params) for config in configs]
+
+    n = len(configs) * len(pv_areas)
+    max_nodes = max(num_nodes_list)
+    result = {
+        "num_nodes": np.empty(n, dtype=np.int32),
+        "S_mm2": np.empty(n),
+        "L_m": np.empty(n),
+        "pv_area": np.empty(n),
+        "vm_pu": np.full((n, len(radiation), max_nodes + 1), np.nan),
+        "pl_mw": np.full((n, len(radiation), max_nodes), np.nan),
+    }
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for i, (config, (vm_pu, pl_mw)) in enumerate(zip(configs, pool.map(_run_config, jobs))):
+            rows = slice(i * len(pv_areas), (i + 1) * len(pv_areas))
+            num_nodes, S_mm2, L_m = config
+            result["num_nodes"][rows] = num_nodes
+            result["S_mm2"][rows] = S_mm2
+            result["L_m"][rows] = L_m
+            result["pv_area"][rows] = pv_areas
+            result["vm_pu"][rows, :, :num_nodes + 1] = vm_pu
+            result["pl_mw"][rows, :, :num_nodes] = pl_mw
+
+    # Погонные параметры линий всех сценариев — одним векторным расчётом
+    (result["r_ohm_per_km"], result["x_ohm_per_km"], result["c_nf_per_km"]) = pn.calculate_line_parameters(
+        result["S_mm2"], line_params["D"], result["L_m"], line_params["f"],
+        line_params["rho"], line_params["epsilon"], line_params["mu_0"])
+    result["v_min_pu"] = np.nanmin(result["vm_pu"], axis=(1, 2))
+    result["v_max_pu"] = np.nanmax(result["vm_pu"], axis=(1, 2))
+    result["loss_mwh"] = np.nansum(result["pl_mw"], axis=(1, 2)) * step_hours
+    return result
+
+
+def summary(result):
+    """Сводка по сценариям: параметры и экстремумы напряжения/потери."""
+    keys = ["num_nodes", "S_mm2", "L_m", "pv_area", "r_ohm_per_km", "x_ohm_per_km",
+            "v_min_pu", "v_max_pu", "loss_mwh"]
+    return pd.DataFrame({key: result[key] for key in keys})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перебор сценариев сети по сетке параметров")
+    parser.add_argument("rad_file", help="CSV с колонкой rad (как rad_2024-08-28.csv)")
+    parser.add_argument("out_file", help="файл результатов .npz")
+    parser.add_argument("--num-nodes", type=int, nargs="+", default=[3])
+    parser.add_argument("--S", type=float, nargs="+", default=[50], help="сечение, мм²")
+    parser.add_argument("--L", type=float, nargs="+", default=[30], help="длина участка, м")
+    parser.add_argument("--pv-area", type=float, nargs="+", default=[10], help="площадь СЭС, м²")
+    parser.add_argument("--load", type=float, default=600000, help="суммарная нагрузка, Вт")
+    parser.add_argument("--step-hours", type=float, default=1.0, help="длительность шага, ч")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    solar_data = pd.read_csv(args.rad_file)
+    result = run_sweep(solar_data["rad"].values, args.num_nodes, args.S, args.L, args.pv_area,
+                       args.load, step_hours=args.step_hours, max_workers=args.workers)
+    np.savez_compressed(args.out_file, **result)
+    print(summary(result))